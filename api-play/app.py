@@ -1,18 +1,371 @@
-from flask import Flask, request, Response
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, g, request, Response, stream_with_context
 from flask_cors import CORS
 from google_play_scraper import Sort, reviews
-import pandas as pd
-import io
 from datetime import datetime
+import metrics
+from formats import FORMATS, compress_stream, generate_csv, negotiate_format
+from response_cache import ResponseCache
+from review_store import DATETIME_FIELDS, REVIEW_FIELDS, SEARCH_ORDER, ReviewStore
+from sync_cursor import decode_cursor, encode_cursor
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Sync-Cursor"])
+
+# Number of reviews requested from Google Play per upstream page
+PAGE_SIZE = int(os.environ.get('REVIEWS_PAGE_SIZE', 200))
+
+# Local review store; set REVIEW_STORE_PATH to an empty string to disable it
+REVIEW_STORE_PATH = os.environ.get('REVIEW_STORE_PATH', 'reviews.db')
+
+# Seconds after a sync during which open-ended queries are served from the store alone
+REVIEW_STORE_MAX_AGE = int(os.environ.get('REVIEW_STORE_MAX_AGE', 60))
+
+review_store = ReviewStore(REVIEW_STORE_PATH) if REVIEW_STORE_PATH else None
+
+# In-process cache of recent results; set RESPONSE_CACHE_SIZE=0 to disable it
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 128))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+RESPONSE_CACHE_MAX_ROWS = int(os.environ.get('RESPONSE_CACHE_MAX_ROWS', 20000))
+RESPONSE_CACHE_WAIT_TIMEOUT = float(os.environ.get('RESPONSE_CACHE_WAIT_TIMEOUT', 30))
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ROWS, RESPONSE_CACHE_WAIT_TIMEOUT
+) if RESPONSE_CACHE_SIZE > 0 else None
+
+# Batch fan-out limits
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 32))
+BATCH_MAX_TARGETS = int(os.environ.get('BATCH_MAX_TARGETS', 500))
+
+# Add a Server-Timing header to every response (or pass timing=1 per request)
+SERVER_TIMING = os.environ.get('SERVER_TIMING') == '1'
+
+# Search results per page: the default and the most a request may ask for
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', 100))
+
+# Columns of the combined batch CSV: the target, the review and any per-target error
+BATCH_COLUMNS = ['app_id', 'lang', 'country'] + REVIEW_FIELDS + ['error']
+
+def fetch_review_pages(app_id, lang, country, page_size=PAGE_SIZE):
+    """Yield raw pages of reviews from Google Play, newest first"""
+    continuation_token = None
+
+    while True:
+        # The continuation token carries lang/country/sort/page size for follow-up pages
+        with metrics.timed('upstream'):
+            page, continuation_token = reviews(
+                app_id,
+                lang=lang,
+                country=country,
+                sort=Sort.NEWEST,
+                count=page_size,
+                continuation_token=continuation_token
+            )
+        metrics.UPSTREAM_PAGES.inc()
+        metrics.UPSTREAM_REVIEWS.inc(len(page))
+        if not page:
+            break
+
+        yield page
+
+        if continuation_token.token is None:
+            break
+
+def fetch_stored_review_pages(app_id, lang, country, page_size, count=None, from_date=None, to_date=None):
+    """Yield pages from the local review store, scraping only what it does not cover.
+
+    If the stored window does not reach back to from_date (or hold count
+    reviews), the request is scraped from Google Play and recorded on the way
+    through. Otherwise only the reviews newer than the newest stored one are
+    scraped, unless the store was synced recently or to_date is already covered.
+    """
+    coverage = review_store.get_coverage(app_id, lang, country)
+
+    if coverage is not None:
+        if from_date:
+            covered = coverage['oldest_at'] <= from_date
+        else:
+            covered = review_store.count_reviews(
+                app_id, lang, country, coverage['oldest_at'], to_date
+            ) >= count
+    if coverage is None or not covered:
+        yield from review_store.record_pages(
+            app_id, lang, country, fetch_review_pages(app_id, lang, country, page_size)
+        )
+        return
+
+    sync_age = (datetime.now() - coverage['synced_at']).total_seconds()
+    if (to_date and to_date <= coverage['synced_at']) or sync_age < REVIEW_STORE_MAX_AGE:
+        yield from review_store.iter_pages(
+            app_id, lang, country, from_date, to_date, page_size=page_size
+        )
+        return
+
+    # Fetch only the gap between the newest stored review and now
+    newest_at = coverage['newest_at']
+    gap_pages = review_store.record_pages(
+        app_id, lang, country, fetch_review_pages(app_id, lang, country, page_size)
+    )
+    try:
+        for page in gap_pages:
+            newer = [review for review in page if review.get('at') is None or review['at'] >= newest_at]
+            if newer:
+                yield newer
+            if len(newer) < len(page):
+                break
+    finally:
+        gap_pages.close()
+
+    # Everything older than the gap is already in the store
+    yield from review_store.iter_pages(
+        app_id, lang, country, from_date, to_date, before=newest_at, page_size=page_size
+    )
+
+def iter_review_pages(app_id, lang, country, count=None, from_date=None, to_date=None):
+    """Yield pages of reviews inside [from_date, to_date], newest first.
+
+    Reviews newer than to_date are skipped, and paging stops at the first
+    review older than from_date. count, if given, caps the number of
+    reviews yielded.
+    """
+    remaining = count
+
+    # Without a date window the upstream page can be sized to the cap exactly
+    page_size = PAGE_SIZE
+    if count is not None and not (from_date or to_date):
+        page_size = min(PAGE_SIZE, count)
+
+    if review_store is not None:
+        pages = fetch_stored_review_pages(app_id, lang, country, page_size, count, from_date, to_date)
+    else:
+        pages = fetch_review_pages(app_id, lang, country, page_size)
+
+    try:
+        for page in pages:
+            # Reviews arrive newest first, so anything before from_date ends the scrape
+            with metrics.timed('filter'):
+                crossed_from_date = False
+                in_window = []
+                for review in page:
+                    at = review.get('at')
+                    if at is not None:
+                        if to_date and at > to_date:
+                            continue
+                        if from_date and at < from_date:
+                            crossed_from_date = True
+                            break
+                    in_window.append(review)
+
+                if remaining is not None:
+                    in_window = in_window[:remaining]
+                    remaining -= len(in_window)
+            if in_window:
+                yield in_window
+
+            if crossed_from_date or remaining == 0:
+                break
+    finally:
+        pages.close()
+
+def parse_date_range(from_date, to_date):
+    """Parse YYYY-MM-DD date bounds, extending to_date to the end of its day"""
+    if from_date:
+        from_date = datetime.strptime(from_date, '%Y-%m-%d')
+    if to_date:
+        to_date = datetime.strptime(to_date, '%Y-%m-%d')
+        # Include the whole end date
+        to_date = datetime(to_date.year, to_date.month, to_date.day, 23, 59, 59)
+    return from_date or None, to_date or None
+
+def get_review_pages(app_id, lang, country, count=None, from_date=None, to_date=None):
+    """Return an iterator of review pages, served from the response cache when possible"""
+    def fetch_pages():
+        return iter_review_pages(app_id, lang, country, count, from_date, to_date)
+
+    if response_cache is None:
+        return fetch_pages()
+
+    key = (app_id, count, lang, country, from_date, to_date)
+    return response_cache.get_pages(key, fetch_pages)
+
+def iter_batch_pages(targets, count, from_date, to_date, concurrency):
+    """Fetch review pages for several targets concurrently, yielding tagged pages.
+
+    Each target is fetched on a pool of at most `concurrency` threads. Pages are
+    handed over through a bounded queue as soon as they arrive, so memory stays
+    bounded by the consumer rather than by the size of the batch.
+    """
+    results = queue.Queue(maxsize=concurrency * 2)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up when the consumer has gone away
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch(target):
+        tag = {'app_id': target['app_id'], 'lang': target['lang'], 'country': target['country']}
+        try:
+            for page in get_review_pages(
+                target['app_id'], target['lang'], target['country'], count, from_date, to_date
+            ):
+                metrics.REVIEWS_SERVED.inc(len(page), endpoint='get_reviews_batch')
+                if not put([{**tag, **review} for review in page]):
+                    return
+        except Exception as e:
+            metrics.ERRORS.inc(endpoint='get_reviews_batch', type=type(e).__name__)
+            put([{**tag, 'error': str(e)}])
+        finally:
+            put(done)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = []
+    try:
+        for target in targets:
+            futures.append(executor.submit(fetch, target))
+
+        pending = len(targets)
+        while pending:
+            item = results.get()
+            if item is done:
+                pending -= 1
+            else:
+                yield item
+    finally:
+        stop.set()
+        # Targets not started yet are dropped; running ones stop at their next page
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def compute_review_stats(df, top_n):
+    """Aggregate a DataFrame of reviews into a compact summary.
+
+    Reviews without a score count towards volumes but not averages, and
+    reviews without a date are left out of the daily and weekly volumes.
+    """
+    import pandas as pd
+
+    def average(mean):
+        return round(float(mean), 2) if pd.notna(mean) else None
+
+    if df.empty:
+        return {
+            "total_reviews": 0,
+            "average_score": None,
+            "score_distribution": {str(score): 0 for score in range(1, 6)},
+            "daily_volume": [],
+            "weekly_volume": [],
+            "versions": [],
+            "top_reviews": [],
+        }
+
+    df = df.assign(
+        at=pd.to_datetime(df['at']),
+        score=pd.to_numeric(df['score'], errors='coerce'),
+        thumbsUpCount=df['thumbsUpCount'].fillna(0),
+    )
+    score_counts = df['score'].value_counts().reindex(range(1, 6), fill_value=0)
+
+    def volume(period):
+        grouped = df.groupby(period)['score'].agg(['size', 'mean']).sort_index()
+        return [
+            {"date": date, "count": int(size), "average_score": average(mean)}
+            for date, size, mean in zip(grouped.index.strftime('%Y-%m-%d'), grouped['size'], grouped['mean'])
+        ]
+
+    versions = (
+        df.groupby(df['reviewCreatedVersion'].fillna('unknown'))['score']
+        .agg(['size', 'mean'])
+        .sort_values('size', ascending=False)
+    )
+
+    top = df.nlargest(top_n, 'thumbsUpCount')
+    return {
+        "total_reviews": int(len(df)),
+        "average_score": average(df['score'].mean()),
+        "score_distribution": {str(score): int(n) for score, n in score_counts.items()},
+        "daily_volume": volume(df['at'].dt.floor('D')),
+        "weekly_volume": volume(df['at'].dt.to_period('W').dt.start_time),
+        "versions": [
+            {"version": str(version), "count": int(size), "average_score": average(mean)}
+            for version, size, mean in zip(versions.index, versions['size'], versions['mean'])
+        ],
+        "top_reviews": [
+            {
+                "reviewId": review_id,
+                "content": content,
+                "score": int(score) if pd.notna(score) else None,
+                "thumbsUpCount": int(thumbs_up),
+                "at": at.isoformat() if pd.notna(at) else None,
+            }
+            for review_id, content, score, thumbs_up, at in zip(
+                top['reviewId'], top['content'], top['score'], top['thumbsUpCount'], top['at']
+            )
+        ],
+    }
+
+def count_served(pages, endpoint):
+    """Count reviews as they are handed to the serializer"""
+    for page in pages:
+        metrics.REVIEWS_SERVED.inc(len(page), endpoint=endpoint)
+        yield page
+
+def metered_body(chunks, endpoint, started):
+    """Record size, duration and failures of a streamed response body"""
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    except Exception as e:
+        metrics.ERRORS.inc(endpoint=endpoint, type=type(e).__name__)
+        raise
+    finally:
+        metrics.RESPONSE_BYTES.observe(size, endpoint=endpoint)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+@app.before_request
+def start_request_metrics():
+    g.started = time.perf_counter()
+    g.timings = metrics.start_request_timings()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    metrics.RESPONSES.inc(endpoint=endpoint, status=response.status_code)
+
+    # Streamed bodies only report timings for the work done before the first byte
+    if SERVER_TIMING or request.args.get('timing') == '1':
+        response.headers['Server-Timing'] = metrics.server_timing_header(
+            g.timings, time.perf_counter() - g.started
+        )
+
+    if response.is_streamed:
+        response.response = metered_body(response.iter_encoded(), endpoint, g.started)
+    else:
+        metrics.RESPONSE_BYTES.observe(response.content_length or 0, endpoint=endpoint)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint=endpoint)
+    return response
 
 @app.route('/api/reviews', methods=['GET'])
 def get_reviews():
     # Get parameters from request
     app_id = request.args.get('app_id')
-    count = request.args.get('count', default=100, type=int)
+    count = request.args.get('count', type=int)
     lang = request.args.get('lang', default='en')
     country = request.args.get('country', default='us')
     from_date = request.args.get('from_date')
@@ -21,61 +374,231 @@ def get_reviews():
     # Validate required parameters
     if not app_id:
         return {"error": "app_id parameter is required"}, 400
+
+    output_format = negotiate_format(request.args.get('format'), request.accept_mimetypes)
+    if output_format is None:
+        return {"error": f"Unsupported format. Use one of: {', '.join(FORMATS)}."}, 400
+    mimetype, extension, serialize, is_text = FORMATS[output_format]
     
     # Validate date formats if provided
     try:
-        if from_date:
-            from_date = datetime.strptime(from_date, '%Y-%m-%d')
-        if to_date:
-            to_date = datetime.strptime(to_date, '%Y-%m-%d')
+        from_date, to_date = parse_date_range(from_date, to_date)
     except ValueError:
         return {"error": "Invalid date format. Use YYYY-MM-DD format."}, 400
-    
+
+    # A sync cursor only asks for reviews newer than the one it points at
+    cursor = request.args.get('cursor')
+    cursor_id = None
+    if cursor:
+        try:
+            cursor_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+        from_date = max(from_date, cursor_at) if from_date else cursor_at
+
+    # With a from_date the date window bounds the scrape, so count is only a cap
+    if count is None and not from_date:
+        count = 100
+
     try:
-        # Fetch reviews using google-play-scraper
-        result, continuation_token = reviews(
-            app_id,
-            lang=lang,
-            country=country,
-            sort=Sort.NEWEST,
-            count=count
-        )
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(result)
-        
-        # Apply date filtering if specified
-        if from_date or to_date:
-            # Convert 'at' column to datetime
-            df['at'] = pd.to_datetime(df['at'])
-            
-            if from_date:
-                df = df[df['at'] >= from_date]
-            if to_date:
-                # Add one day to include the end date
-                to_date = datetime(to_date.year, to_date.month, to_date.day, 23, 59, 59)
-                df = df[df['at'] <= to_date]
-        
-        # Remove userName and userImage fields
-        columns_to_drop = ['userName', 'userImage']
-        df = df.drop(columns=[col for col in columns_to_drop if col in df.columns])
-        
-        # Generate CSV
-        csv_data = io.StringIO()
-        df.to_csv(csv_data, index=False)
-        
-        # Create response with CSV data
+        # Fetch the first page up front so upstream errors still map to a 500
+        pages = get_review_pages(app_id, lang, country, count, from_date, to_date)
+        if cursor_id:
+            # Reviews sharing the cursor's timestamp may be repeated, but never the cursor itself
+            pages = ([review for review in page if review['reviewId'] != cursor_id] for page in pages)
+            pages = (page for page in pages if page)
+        pages = count_served(pages, 'get_reviews')
+        first_page = next(pages, [])
+        body = serialize(itertools.chain([first_page], pages))
+
+        headers = {
+            "Content-disposition": f"attachment; filename={app_id}_reviews.{extension}",
+            "Vary": "Accept, Accept-Encoding",
+        }
+
+        # Reviews are served newest first, so the first one is where the next sync starts
+        if first_page and first_page[0].get('at') is not None:
+            headers["X-Sync-Cursor"] = encode_cursor(first_page[0])
+        elif cursor:
+            headers["X-Sync-Cursor"] = cursor
+
+        # Text formats compress well; columnar formats are already compressed
+        encoding = request.accept_encodings.best_match(['gzip', 'deflate']) if is_text else None
+        if encoding:
+            body = compress_stream(body, encoding)
+            headers["Content-Encoding"] = encoding
+
+        # Stream the remaining pages while they are being fetched
         response = Response(
-            csv_data.getvalue(),
-            mimetype="text/csv",
-            headers={"Content-disposition": f"attachment; filename={app_id}_reviews.csv"}
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers=headers
         )
         
         return response
     
     except Exception as e:
+        metrics.ERRORS.inc(endpoint='get_reviews', type=type(e).__name__)
         return {"error": str(e)}, 500
 
+@app.route('/api/reviews/stats', methods=['GET'])
+def get_review_stats():
+    app_id = request.args.get('app_id')
+    count = request.args.get('count', type=int)
+    lang = request.args.get('lang', default='en')
+    country = request.args.get('country', default='us')
+    top_n = request.args.get('top', default=5, type=int)
+
+    if not app_id:
+        return {"error": "app_id parameter is required"}, 400
+
+    try:
+        from_date, to_date = parse_date_range(request.args.get('from_date'), request.args.get('to_date'))
+    except ValueError:
+        return {"error": "Invalid date format. Use YYYY-MM-DD format."}, 400
+
+    if count is None and not from_date:
+        count = 100
+
+    try:
+        rows = [
+            review
+            for page in get_review_pages(app_id, lang, country, count, from_date, to_date)
+            for review in page
+        ]
+        # pandas is only loaded by the endpoints that aggregate
+        import pandas as pd
+
+        df = pd.DataFrame(rows, columns=['reviewId', 'content', 'score', 'thumbsUpCount', 'reviewCreatedVersion', 'at'])
+        stats = compute_review_stats(df, top_n)
+        metrics.REVIEWS_SERVED.inc(len(rows), endpoint='get_review_stats')
+    except Exception as e:
+        metrics.ERRORS.inc(endpoint='get_review_stats', type=type(e).__name__)
+        return {"error": str(e)}, 500
+
+    return {"app_id": app_id, "lang": lang, "country": country, **stats}
+
+@app.route('/api/reviews/batch', methods=['POST'])
+def get_reviews_batch():
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('targets'), list) or not data['targets']:
+        return {"error": "targets must be a non-empty list"}, 400
+    if len(data['targets']) > BATCH_MAX_TARGETS:
+        return {"error": f"At most {BATCH_MAX_TARGETS} targets are allowed per batch"}, 400
+
+    # Targets inherit lang/country from the top level of the request
+    default_lang = data.get('lang', 'en')
+    default_country = data.get('country', 'us')
+    targets = []
+    for target in data['targets']:
+        if not isinstance(target, dict) or not target.get('app_id'):
+            return {"error": "Every target requires an app_id"}, 400
+        targets.append({
+            'app_id': target['app_id'],
+            'lang': target.get('lang', default_lang),
+            'country': target.get('country', default_country),
+        })
+
+    try:
+        from_date, to_date = parse_date_range(data.get('from_date'), data.get('to_date'))
+    except ValueError:
+        return {"error": "Invalid date format. Use YYYY-MM-DD format."}, 400
+
+    count = data.get('count')
+    if count is None and not from_date:
+        count = 100
+    try:
+        concurrency = int(data.get('concurrency', BATCH_CONCURRENCY))
+        if count is not None:
+            count = int(count)
+    except (TypeError, ValueError):
+        return {"error": "count and concurrency must be integers"}, 400
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(targets)))
+
+    pages = iter_batch_pages(targets, count, from_date, to_date, concurrency)
+    return Response(
+        stream_with_context(generate_csv(pages, BATCH_COLUMNS)),
+        mimetype="text/csv",
+        headers={"Content-disposition": "attachment; filename=batch_reviews.csv"}
+    )
+
+@app.route('/api/reviews/search', methods=['GET'])
+def search_reviews():
+    if review_store is None:
+        return {"error": "Search requires the local review store (REVIEW_STORE_PATH)"}, 503
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return {"error": "q parameter is required"}, 400
+    order = request.args.get('sort', default='relevance')
+    if order not in SEARCH_ORDER:
+        return {"error": f"Unsupported sort. Use one of: {', '.join(SEARCH_ORDER)}."}, 400
+
+    try:
+        from_date, to_date = parse_date_range(request.args.get('from_date'), request.args.get('to_date'))
+    except ValueError:
+        return {"error": "Invalid date format. Use YYYY-MM-DD format."}, 400
+
+    min_score = request.args.get('min_score', type=int)
+    max_score = request.args.get('max_score', type=int)
+    limit = max(1, min(request.args.get('limit', default=SEARCH_PAGE_SIZE, type=int), SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', default=0, type=int))
+
+    # Only reviews already in the store are searched; nothing is fetched from Google Play
+    try:
+        results, has_more = review_store.search(
+            query,
+            app_id=request.args.get('app_id'),
+            lang=request.args.get('lang'),
+            country=request.args.get('country'),
+            from_date=from_date,
+            to_date=to_date,
+            min_score=min_score,
+            max_score=max_score,
+            order=order,
+            limit=limit,
+            offset=offset,
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        metrics.ERRORS.inc(endpoint='search_reviews', type=type(e).__name__)
+        return {"error": str(e)}, 500
+
+    for review in results:
+        for field in DATETIME_FIELDS:
+            if review[field] is not None:
+                review[field] = review[field].isoformat()
+    metrics.REVIEWS_SERVED.inc(len(results), endpoint='search_reviews')
+
+    return {
+        "query": query,
+        "sort": order,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if has_more else None,
+        "results": results,
+    }
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    extra_lines = []
+    if response_cache is not None:
+        stats = response_cache.stats()
+        for name in ('hits', 'misses', 'coalesced', 'evictions', 'expirations'):
+            extra_lines += [
+                f'# TYPE api_response_cache_{name}_total counter',
+                f'api_response_cache_{name}_total {stats[name]}',
+            ]
+        extra_lines += ['# TYPE api_response_cache_entries gauge', f"api_response_cache_entries {stats['entries']}"]
+    return Response(metrics.render(extra_lines), mimetype='text/plain; version=0.0.4')
+
 @app.route('/', methods=['GET'])
 def home():
     return """
@@ -83,12 +606,14 @@ def home():
     <p>Use the /api/reviews endpoint with the following parameters:</p>
     <ul>
         <li><strong>app_id</strong>: The package name of the app (e.g., org.supertuxkart.stk)</li>
-        <li><strong>count</strong>: The number of reviews to fetch (default: 100)</li>
+        <li><strong>count</strong>: The maximum number of reviews to return (default: 100, or no limit when from_date is set)</li>
         <li><strong>lang</strong>: The language of the reviews (default: en)</li>
         <li><strong>country</strong>: The country for the reviews (default: us)</li>
         <li><strong>from_date</strong>: Filter reviews from this date (format: YYYY-MM-DD)</li>
         <li><strong>to_date</strong>: Filter reviews until this date (format: YYYY-MM-DD)</li>
+        <li><strong>cursor</strong>: Only return reviews newer than the X-Sync-Cursor header of a previous response</li>
     </ul>
+    <p>Search the reviews fetched so far with /api/reviews/search?q=..., e.g. <a href="/api/reviews/search?q=crash&app_id=org.supertuxkart.stk">/api/reviews/search?q=crash&app_id=org.supertuxkart.stk</a></p>
     <p>Example: <a href="/api/reviews?app_id=org.supertuxkart.stk&count=50&lang=en&country=us">/api/reviews?app_id=org.supertuxkart.stk&count=50&lang=en&country=us</a></p>
     <p>Example with date filtering: <a href="/api/reviews?app_id=org.supertuxkart.stk&from_date=2023-01-01&to_date=2023-12-31">/api/reviews?app_id=org.supertuxkart.stk&from_date=2023-01-01&to_date=2023-12-31</a></p>
     """
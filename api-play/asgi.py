@@ -0,0 +1,173 @@
+"""
+ASGI entry point for the Google Play Reviews API.
+
+Serves the Flask app from an asyncio event loop so that one process can hold
+hundreds of in-flight requests:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8080
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+
+google-play-scraper is synchronous, so every call into the Flask app, and
+every step of a streamed response body (which is where upstream pages are
+fetched), runs on a thread pool and is awaited. The event loop only holds
+connections; threads are occupied only while an upstream page is actually
+being fetched. Requests that scrape Google Play use their own pool, so `/`,
+`/api/cache` and other quick endpoints never wait behind slow scrapes.
+"""
+
+import asyncio
+import contextvars
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+# Threads for blocking upstream work; bounds concurrent page fetches, not connections
+SCRAPE_THREADS = int(os.environ.get('ASGI_SCRAPE_THREADS', 256))
+
+# Threads for everything else
+FAST_THREADS = int(os.environ.get('ASGI_FAST_THREADS', 16))
+
+# Paths whose handlers may call Google Play
+SCRAPE_PATH_PREFIX = '/api/reviews'
+
+scrape_executor = ThreadPoolExecutor(max_workers=SCRAPE_THREADS, thread_name_prefix='scrape')
+fast_executor = ThreadPoolExecutor(max_workers=FAST_THREADS, thread_name_prefix='fast')
+
+_END = object()
+
+# Calls submitted to either pool and not finished yet, so shutdown can cancel them
+_pending = set()
+
+
+def _next_chunk(iterator):
+    return next(iterator, _END)
+
+
+def _run(executor, fn, *args):
+    """Run a blocking call on a pool, returning an awaitable for its result"""
+    future = executor.submit(fn, *args)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+    return asyncio.wrap_future(future)
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+async def handle_http(scope, receive, send):
+    body = await _read_body(receive)
+    if body is None:
+        return
+
+    executor = scrape_executor if scope['path'].startswith(SCRAPE_PATH_PREFIX) else fast_executor
+    environ = build_environ(scope, body)
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+
+    # Every step runs in one context, since Flask keeps its request context in
+    # context variables and streamed bodies re-enter it on each chunk
+    context = contextvars.copy_context()
+
+    # Calling the app runs the view, including the first upstream page
+    app_iter = await _run(executor, context.run, flask_app, environ, start_response)
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': response_start['status'],
+            'headers': response_start['headers'],
+        })
+        iterator = iter(app_iter)
+        while not disconnected.is_set():
+            chunk = await _run(executor, context.run, _next_chunk, iterator)
+            if chunk is _END:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        watcher.cancel()
+        # Closing the iterator stops any scrape the client no longer needs
+        if hasattr(app_iter, 'close'):
+            await _run(executor, context.run, app_iter.close)
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Calls that have not started yet are dropped; running ones finish on their own
+            for future in list(_pending):
+                future.cancel()
+            scrape_executor.shutdown(wait=False)
+            fast_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        await handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
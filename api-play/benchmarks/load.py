@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for /api/reviews.
+
+Starts a fresh API server backed by the offline scraper stub for every
+configuration, drives /api/reviews at each combination of concurrency and
+count, and reports throughput, p50/p95/p99 latency and the server's peak RSS.
+Each request uses a distinct app_id so the response cache and the review
+store (both disabled by default) cannot hide the cost of a scrape.
+
+Usage:
+    python benchmarks/load.py --counts 100,1000,10000,100000 --concurrency 1,8,32 \
+        --requests 16 --page-latency 0.05 --json results.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, total, page_latency, env):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, 'stub_server.py'),
+         '--port', str(port), '--total', str(total), '--page-latency', str(page_latency)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('API server did not start')
+
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process in MiB (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_configuration(port, count, concurrency, requests, extra_params):
+    def fetch(index):
+        url = f'http://127.0.0.1:{port}/api/reviews?app_id=bench.app{index}&count={count}{extra_params}'
+        start = time.perf_counter()
+        first_byte = None
+        size = 0
+        with urllib.request.urlopen(url, timeout=600) as response:
+            while True:
+                chunk = response.read(65536)
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                if not chunk:
+                    break
+                size += len(chunk)
+        return time.perf_counter() - start, first_byte, size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fetch, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _, _ in results)
+    first_bytes = sorted(first_byte for _, first_byte, _ in results)
+    return {
+        'count': count,
+        'concurrency': concurrency,
+        'requests': requests,
+        'throughput_rps': requests / elapsed,
+        'reviews_per_s': requests * count / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'ttfb_p50_ms': percentile(first_bytes, 0.50) * 1000,
+        'mean_bytes': sum(size for _, _, size in results) / requests,
+    }
+
+
+def parse_ints(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/reviews throughput and latency offline')
+    parser.add_argument('--counts', type=parse_ints, default=[100, 1000, 10000, 100000],
+                        help='Comma-separated review counts (default: 100,1000,10000,100000)')
+    parser.add_argument('--concurrency', type=parse_ints, default=[1, 8, 32],
+                        help='Comma-separated concurrency levels (default: 1,8,32)')
+    parser.add_argument('--requests', type=int, default=16,
+                        help='Requests per configuration, at least the concurrency (default: 16)')
+    parser.add_argument('--page-latency', type=float, default=0.05,
+                        help='Simulated seconds per upstream page (default: 0.05)')
+    parser.add_argument('--params', default='', help='Extra query string, e.g. "&format=parquet"')
+    parser.add_argument('--cache', action='store_true', help='Keep the response cache and review store enabled')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not args.cache:
+        env.update({'REVIEW_STORE_PATH': '', 'RESPONSE_CACHE_SIZE': '0'})
+    else:
+        # The stub server keeps its store in a temporary file, but only enables the cache when asked
+        env.setdefault('RESPONSE_CACHE_SIZE', '128')
+
+    header = f"{'count':>7} {'conc':>5} {'req/s':>8} {'reviews/s':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttfb ms':>8} {'peak RSS':>9}"
+    print(header)
+    print('-' * len(header))
+
+    results = []
+    for count in args.counts:
+        for concurrency in args.concurrency:
+            port = free_port()
+            server = start_server(port, max(args.counts), args.page_latency, env)
+            try:
+                result = run_configuration(
+                    port, count, concurrency, max(args.requests, concurrency), args.params
+                )
+                result['peak_rss_mb'] = peak_rss_mb(server.pid)
+            finally:
+                server.terminate()
+                server.wait()
+            results.append(result)
+
+            rss = f"{result['peak_rss_mb']:.0f} MiB" if result['peak_rss_mb'] is not None else 'n/a'
+            print(f"{count:>7} {concurrency:>5} {result['throughput_rps']:>8.2f} {result['reviews_per_s']:>11.0f} "
+                  f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                  f"{result['ttfb_p50_ms']:>8.1f} {rss:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Offline stand-in for google_play_scraper.reviews.
+
+Serves reviews generated from a recorded fixture instead of calling Google
+Play. Reviews are returned newest first in pages, with continuation tokens that
+behave like the real ones, and an optional delay per page to simulate upstream
+latency. Review i of an app is fixture[i % len(fixture)] with a unique reviewId
+and a timestamp `interval` older than review i - 1.
+
+To refresh the fixture from the live Play Store:
+    python benchmarks/scraper_stub.py record org.supertuxkart.stk --count 200
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'reviews.json')
+
+
+class StubContinuationToken:
+    """Mirrors the attributes of google_play_scraper's continuation token"""
+
+    def __init__(self, token, lang, country, sort, count):
+        self.token = token
+        self.lang = lang
+        self.country = country
+        self.sort = sort
+        self.count = count
+
+
+def load_fixture(path=DEFAULT_FIXTURE):
+    """Load recorded reviews, parsing their timestamps"""
+    with open(path) as f:
+        fixture = json.load(f)
+    for review in fixture:
+        for field in ('at', 'repliedAt'):
+            if review.get(field):
+                review[field] = datetime.fromisoformat(review[field])
+    return fixture
+
+
+class StubScraper:
+    """Deterministic, offline replacement for google_play_scraper.reviews"""
+
+    def __init__(self, fixture=None, total=100000, page_latency=0.0, interval=timedelta(minutes=7), newest=None):
+        self.fixture = fixture if fixture is not None else load_fixture()
+        self.total = total
+        self.page_latency = page_latency
+        self.interval = interval
+        self.newest = newest or datetime.now().replace(second=0, microsecond=0)
+        self.pages_served = 0
+
+    def review(self, app_id, index):
+        review = dict(self.fixture[index % len(self.fixture)])
+        review['reviewId'] = f'stub:{app_id}:{index}'
+        review['at'] = self.newest - self.interval * index
+        if review.get('replyContent'):
+            review['repliedAt'] = review['at'] + timedelta(days=1)
+        return review
+
+    def reviews(self, app_id, lang='en', country='us', sort=None, count=100,
+                filter_score_with=None, filter_device_with=None, continuation_token=None):
+        if continuation_token is not None:
+            if continuation_token.token is None:
+                return [], continuation_token
+            start = continuation_token.token
+            lang = continuation_token.lang
+            country = continuation_token.country
+            sort = continuation_token.sort
+            count = continuation_token.count
+        else:
+            start = 0
+
+        if self.page_latency:
+            time.sleep(self.page_latency)
+        self.pages_served += 1
+
+        end = min(start + count, self.total)
+        page = [self.review(app_id, index) for index in range(start, end)]
+        return page, StubContinuationToken(end if end < self.total else None, lang, country, sort, count)
+
+
+def record(app_id, count, lang, country, path):
+    """Record live reviews from Google Play into a fixture file"""
+    from google_play_scraper import Sort, reviews
+
+    result, _ = reviews(app_id, lang=lang, country=country, sort=Sort.NEWEST, count=count)
+    for review in result:
+        # Do not keep personal data in the fixture
+        review['userName'] = 'A Google user'
+        review['userImage'] = None
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, default=lambda value: value.isoformat(), ensure_ascii=False)
+    print(f"Recorded {len(result)} reviews to {path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the recorded review fixture')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='Record live reviews into the fixture')
+    record_parser.add_argument('app_id', help='The package name of the app (e.g., org.supertuxkart.stk)')
+    record_parser.add_argument('--count', type=int, default=200, help='The number of reviews to record (default: 200)')
+    record_parser.add_argument('--lang', default='en', help='The language of the reviews (default: en)')
+    record_parser.add_argument('--country', default='us', help='The country for the reviews (default: us)')
+    record_parser.add_argument('--output', default=DEFAULT_FIXTURE, help='Fixture path (default: fixtures/reviews.json)')
+    args = parser.parse_args()
+
+    record(args.app_id, args.count, args.lang, args.country, args.output)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Startup and per-request overhead benchmark for the Google Play Reviews API.
+
+Measures how long a fresh interpreter takes to import app.py (the Cloud Run
+cold-start cost), checks that pandas/NumPy are not loaded on import, and times
+/api/reviews requests against an instant in-process stand-in for the scraper
+so that only the API's own overhead is measured.
+
+Usage:
+    python benchmarks/startup.py --runs 10 --requests 200 --max-import-ms 500 --max-request-ms 5
+
+Exits with status 1 when a budget is exceeded or a heavy module is imported.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be loaded just by importing the app
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow']
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_s": elapsed, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_import(runs, env):
+    """Import app.py in fresh interpreters, returning per-run timings"""
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET],
+            cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        process_s = time.perf_counter() - start
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_s'] = process_s
+        results.append(result)
+    return results
+
+
+def measure_requests(requests, count, env):
+    """Time /api/reviews in-process against an instant scraper stand-in"""
+    os.environ.update(env)
+    sys.path.insert(0, API_DIR)
+    import app as api
+
+    sys.path.insert(0, os.path.join(API_DIR, 'benchmarks'))
+    from scraper_stub import StubScraper
+
+    api.reviews = StubScraper(total=count).reviews
+
+    client = api.app.test_client()
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(f'/api/reviews?app_id=bench&count={count}')
+        response.get_data()
+        timings.append(time.perf_counter() - start)
+    heavy = [module for module in HEAVY_MODULES if module in sys.modules]
+    return timings, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark api-play import time and per-request overhead')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreter imports to time (default: 10)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests to time (default: 200)')
+    parser.add_argument('--count', type=int, default=100, help='Reviews per request (default: 100)')
+    parser.add_argument('--max-import-ms', type=float, help='Fail if the median import time exceeds this')
+    parser.add_argument('--max-request-ms', type=float, help='Fail if the median request time exceeds this')
+    args = parser.parse_args()
+
+    # Keep the benchmark independent of any local store or cache state
+    env = {
+        **os.environ,
+        'REVIEW_STORE_PATH': '',
+        'RESPONSE_CACHE_SIZE': '0',
+    }
+
+    failed = False
+
+    imports = measure_import(args.runs, env)
+    import_ms = statistics.median(r['import_s'] for r in imports) * 1000
+    process_ms = statistics.median(r['process_s'] for r in imports) * 1000
+    import_heavy = sorted({m for r in imports for m in r['heavy']})
+    print(f"Import app.py:      median {import_ms:.1f} ms (interpreter + import: {process_ms:.1f} ms)")
+    if import_heavy:
+        print(f"  FAIL: heavy modules loaded on import: {', '.join(import_heavy)}")
+        failed = True
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"  FAIL: exceeds budget of {args.max_import_ms} ms")
+        failed = True
+
+    timings, request_heavy = measure_requests(args.requests, args.count, env)
+    request_ms = statistics.median(timings) * 1000
+    p95_ms = statistics.quantiles(timings, n=20)[-1] * 1000 if len(timings) > 1 else request_ms
+    print(f"GET /api/reviews:   median {request_ms:.2f} ms, p95 {p95_ms:.2f} ms ({args.count} reviews)")
+    if request_heavy:
+        print(f"  FAIL: heavy modules loaded by a CSV request: {', '.join(request_heavy)}")
+        failed = True
+    if args.max_request_ms is not None and request_ms > args.max_request_ms:
+        print(f"  FAIL: exceeds budget of {args.max_request_ms} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
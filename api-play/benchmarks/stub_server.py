@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Run the Google Play Reviews API against the offline scraper stub.
+
+    python benchmarks/stub_server.py --port 8090 --page-latency 0.05 --total 100000
+
+The app is served by Werkzeug's threaded server; it can also be served with
+Gunicorn (`gunicorn --chdir benchmarks stub_server:app`), configured through the
+STUB_TOTAL and STUB_PAGE_LATENCY environment variables.
+
+The stub's reviews are made up, so they never reach a real review store: the
+store is kept in a temporary file deleted on exit (or stays disabled when
+REVIEW_STORE_PATH is empty), and the response cache is off unless
+RESPONSE_CACHE_SIZE is set.
+"""
+
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+# The app reads these on import
+if os.environ.get('REVIEW_STORE_PATH') != '':
+    store_dir = tempfile.mkdtemp(prefix='stub-reviews-')
+    atexit.register(shutil.rmtree, store_dir, ignore_errors=True)
+    os.environ['REVIEW_STORE_PATH'] = os.path.join(store_dir, 'reviews.db')
+os.environ.setdefault('RESPONSE_CACHE_SIZE', '0')
+
+import app as api  # noqa: E402
+from scraper_stub import StubScraper  # noqa: E402
+
+scraper = StubScraper(
+    total=int(os.environ.get('STUB_TOTAL', 100000)),
+    page_latency=float(os.environ.get('STUB_PAGE_LATENCY', 0.0)),
+)
+api.reviews = scraper.reviews
+app = api.app
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+
+    parser = argparse.ArgumentParser(description='Serve api-play with the offline scraper stub')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8090, help='Port to bind (default: 8090)')
+    parser.add_argument('--total', type=int, help='Reviews available per app (default: STUB_TOTAL or 100000)')
+    parser.add_argument('--page-latency', type=float, help='Seconds of delay per upstream page (default: STUB_PAGE_LATENCY or 0)')
+    args = parser.parse_args()
+
+    if args.total is not None:
+        scraper.total = args.total
+    if args.page_latency is not None:
+        scraper.page_latency = args.page_latency
+
+    run_simple(args.host, args.port, app, threaded=True)
@@ -56,6 +56,90 @@ def fetch_reviews(app_id, count=100, lang='en', country='us', from_date=None, to
         print(response.text)
         return None
 
+def fetch_stats(app_id, count=100, lang='en', country='us', from_date=None, to_date=None, top=5):
+    """
+    Fetch aggregated review statistics computed by the API server.
+    
+    This avoids downloading every review when only the rating distribution,
+    volumes and most helpful reviews are needed.
+    
+    Args:
+        app_id (str): The package name of the app
+        count (int, optional): The number of reviews to aggregate. Defaults to 100.
+        lang (str, optional): The language of the reviews. Defaults to 'en'.
+        country (str, optional): The country for the reviews. Defaults to 'us'.
+        from_date (str, optional): Filter reviews from this date (format: YYYY-MM-DD). Defaults to None.
+        to_date (str, optional): Filter reviews until this date (format: YYYY-MM-DD). Defaults to None.
+        top (int, optional): The number of most helpful reviews to include. Defaults to 5.
+    
+    Returns:
+        dict: The statistics returned by /api/reviews/stats
+    """
+    url = "http://localhost:5000/api/reviews/stats"
+    params = {
+        "app_id": app_id,
+        "count": count,
+        "lang": lang,
+        "country": country,
+        "top": top
+    }
+    
+    # Add date filters if provided
+    if from_date:
+        params["from_date"] = from_date
+    if to_date:
+        params["to_date"] = to_date
+    
+    response = requests.get(url, params=params)
+    
+    if response.status_code == 200:
+        return response.json()
+    else:
+        print(f"Error: {response.status_code}")
+        print(response.text)
+        return None
+
+def search_reviews(query, app_id=None, min_score=None, max_score=None, sort='relevance', limit=20, offset=0):
+    """
+    Search the text of the reviews the API server has already fetched.
+    
+    Args:
+        query (str): Words, "quoted phrases" and prefix* terms, combined with OR and NOT
+        app_id (str, optional): Only search the reviews of this app. Defaults to None.
+        min_score (int, optional): The lowest score to include. Defaults to None.
+        max_score (int, optional): The highest score to include. Defaults to None.
+        sort (str, optional): 'relevance' or 'newest'. Defaults to 'relevance'.
+        limit (int, optional): The number of results per page. Defaults to 20.
+        offset (int, optional): The number of results to skip. Defaults to 0.
+    
+    Returns:
+        dict: The page of results returned by /api/reviews/search
+    """
+    url = "http://localhost:5000/api/reviews/search"
+    params = {
+        "q": query,
+        "sort": sort,
+        "limit": limit,
+        "offset": offset
+    }
+    
+    # Add filters if provided
+    if app_id:
+        params["app_id"] = app_id
+    if min_score is not None:
+        params["min_score"] = min_score
+    if max_score is not None:
+        params["max_score"] = max_score
+    
+    response = requests.get(url, params=params)
+    
+    if response.status_code == 200:
+        return response.json()
+    else:
+        print(f"Error: {response.status_code}")
+        print(response.text)
+        return None
+
 def save_to_csv(df, filename):
     """
     Save the DataFrame to a CSV file.
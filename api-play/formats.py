@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+import metrics
+
+from review_store import REVIEW_FIELDS
+
+# Fields removed from every review before it is returned
+COLUMNS_TO_DROP = ['userName', 'userImage']
+
+
+def generate_csv(pages, columns=REVIEW_FIELDS):
+    """Serialize review pages to CSV one page at a time.
+
+    Only the given columns are written, so private fields such as userName
+    and userImage never reach the output. Datetimes are written as
+    YYYY-MM-DD HH:MM:SS and missing values as empty fields.
+    """
+    csv_data = io.StringIO()
+    writer = csv.DictWriter(csv_data, fieldnames=columns, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    for page in pages:
+        with metrics.timed('serialize'):
+            writer.writerows(page)
+        yield csv_data.getvalue()
+        csv_data.seek(0)
+        csv_data.truncate()
+    if csv_data.tell():
+        yield csv_data.getvalue()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def generate_ndjson(pages):
+    """Serialize review pages as one JSON object per line"""
+    for page in pages:
+        with metrics.timed('serialize'):
+            lines = ''.join(
+                json.dumps(
+                    {key: value for key, value in review.items() if key not in COLUMNS_TO_DROP},
+                    default=_json_default,
+                    ensure_ascii=False
+                ) + '\n'
+                for review in page
+            )
+        yield lines
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('reviewId', pa.string()),
+        ('content', pa.string()),
+        ('score', pa.int64()),
+        ('thumbsUpCount', pa.int64()),
+        ('reviewCreatedVersion', pa.string()),
+        ('at', pa.timestamp('us')),
+        ('replyContent', pa.string()),
+        ('repliedAt', pa.timestamp('us')),
+        ('appVersion', pa.string()),
+    ])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator.
+
+    Keeps track of the absolute position so that writers which record
+    offsets (such as Parquet's footer) see a regular, growing file.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def generate_arrow(pages):
+    """Serialize review pages as an Arrow IPC stream, one record batch per page"""
+    import pyarrow as pa
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for page in pages:
+            with metrics.timed('serialize'):
+                writer.write_batch(pa.RecordBatch.from_pylist(page, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def generate_parquet(pages):
+    """Serialize review pages as a Parquet file, one row group per page"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for page in pages:
+            with metrics.timed('serialize'):
+                writer.write_table(pa.Table.from_pylist(page, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# name -> (mimetype, file extension, serializer, text format)
+FORMATS = {
+    'csv': ('text/csv', 'csv', generate_csv, True),
+    'ndjson': ('application/x-ndjson', 'ndjson', generate_ndjson, True),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow', generate_arrow, False),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', generate_parquet, False),
+}
+
+
+def negotiate_format(format_param, accept_mimetypes):
+    """Pick an output format from ?format= or the Accept header.
+
+    An explicit but unknown format returns None; an Accept header that matches
+    none of the formats falls back to CSV.
+    """
+    if format_param:
+        return format_param if format_param in FORMATS else None
+    mimetypes = [mimetype for mimetype, _, _, _ in FORMATS.values()]
+    best = accept_mimetypes.best_match(mimetypes, default='text/csv')
+    return next(name for name, spec in FORMATS.items() if spec[0] == best)
+
+
+def compress_stream(chunks, encoding):
+    """Compress a stream of str/bytes chunks with gzip or deflate, flushing per chunk"""
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        with metrics.timed('compress'):
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,158 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Default histogram buckets, in seconds
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Response size buckets, in bytes
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# Per-request stage timings, used for the Server-Timing header
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, key)} {value:g}')
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with optional labels"""
+
+    def __init__(self, name, documentation, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    labels = _format_labels(self.labels + ('le',), key + (le,))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, key)
+                lines.append(f'{self.name}_sum{labels} {self._sums[key]:g}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram(
+    'api_stage_seconds', 'Time spent in each processing stage', ['stage']
+)
+REQUEST_SECONDS = Histogram(
+    'api_request_seconds', 'Time from request start to the last byte of the response', ['endpoint']
+)
+RESPONSE_BYTES = Histogram(
+    'api_response_bytes', 'Size of response bodies in bytes', ['endpoint'], buckets=SIZE_BUCKETS
+)
+RESPONSES = Counter(
+    'api_responses_total', 'Responses by endpoint and HTTP status', ['endpoint', 'status']
+)
+ERRORS = Counter(
+    'api_errors_total', 'Exceptions raised while handling requests, by type', ['endpoint', 'type']
+)
+UPSTREAM_PAGES = Counter(
+    'api_upstream_pages_total', 'Pages of reviews fetched from Google Play'
+)
+UPSTREAM_REVIEWS = Counter(
+    'api_upstream_reviews_total', 'Reviews fetched from Google Play'
+)
+REVIEWS_SERVED = Counter(
+    'api_reviews_served_total', 'Reviews returned to clients (rate() gives reviews per second)', ['endpoint']
+)
+
+
+def observe_stage(stage, seconds):
+    """Record time spent in a stage, globally and for the current request"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as a processing stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def start_request_timings():
+    """Start collecting stage timings for the current request"""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings, total):
+    """Format stage timings as a Server-Timing header value"""
+    entries = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items()]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def render(extra_lines=()):
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
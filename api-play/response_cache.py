@@ -0,0 +1,125 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+class _Flight:
+    """A fetch in progress that identical requests can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.pages = None
+
+
+class ResponseCache:
+    """Bounded LRU cache of review pages with a per-entry TTL.
+
+    Concurrent misses for the same key are coalesced: the first request
+    fetches and streams the pages while recording them, and identical
+    requests arriving meanwhile wait for it and are served from the result.
+    Waiting ends as soon as the last page has been fetched or the result has
+    grown past max_rows (such results are streamed but not cached), and after
+    wait_timeout seconds at most; a waiter that gets no result fetches itself.
+    """
+
+    def __init__(self, max_entries=128, ttl=300, max_rows=20000, wait_timeout=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_pages(self, key, fetch_pages):
+        """Return an iterator of pages for key, calling fetch_pages() on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, pages = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return iter(pages)
+                del self._entries[key]
+                self.expirations += 1
+
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if leader:
+            try:
+                pages = fetch_pages()
+            except BaseException:
+                self._release(key, flight)
+                raise
+            recorder = self._record(key, flight, pages)
+            # A generator that is never started never runs its finally block,
+            # so the flight is also released when the recorder is collected
+            weakref.finalize(recorder, self._release, key, flight)
+            return recorder
+
+        if flight.done.wait(self.wait_timeout) and flight.pages is not None:
+            return iter(flight.pages)
+        # The shared fetch failed, was abandoned, was too large to keep or is too slow
+        return fetch_pages()
+
+    def _record(self, key, flight, pages):
+        recorded = []
+        rows = 0
+        try:
+            for page in pages:
+                if recorded is not None:
+                    rows += len(page)
+                    if rows <= self.max_rows:
+                        recorded.append(page)
+                    else:
+                        recorded = None
+                        self._release(key, flight)
+                yield page
+            if recorded is not None:
+                flight.pages = recorded
+                self._put(key, recorded)
+        finally:
+            self._release(key, flight)
+
+    def _release(self, key, flight):
+        """Stop coalescing on flight and wake its waiters; safe to call repeatedly"""
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        flight.done.set()
+
+    def _put(self, key, pages):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, pages)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Return the cache counters"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,323 @@
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+
+# Review fields kept in the store (userName and userImage are never persisted)
+REVIEW_FIELDS = [
+    'reviewId', 'content', 'score', 'thumbsUpCount', 'reviewCreatedVersion',
+    'at', 'replyContent', 'repliedAt', 'appVersion'
+]
+
+DATETIME_FIELDS = ('at', 'repliedAt')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    app_id TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    country TEXT NOT NULL,
+    reviewId TEXT NOT NULL,
+    content TEXT,
+    score INTEGER,
+    thumbsUpCount INTEGER,
+    reviewCreatedVersion TEXT,
+    at TEXT,
+    replyContent TEXT,
+    repliedAt TEXT,
+    appVersion TEXT,
+    PRIMARY KEY (app_id, lang, country, reviewId)
+);
+CREATE INDEX IF NOT EXISTS reviews_by_locale_and_time
+    ON reviews (app_id, lang, country, at);
+CREATE TABLE IF NOT EXISTS coverage (
+    app_id TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    country TEXT NOT NULL,
+    oldest_at TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (app_id, lang, country)
+);
+"""
+
+# Full-text index over review and reply text, kept in step with the reviews table by triggers
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(
+    content, replyContent,
+    content='reviews', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS reviews_fts_insert AFTER INSERT ON reviews BEGIN
+    INSERT INTO reviews_fts (rowid, content, replyContent)
+    VALUES (new.rowid, new.content, new.replyContent);
+END;
+CREATE TRIGGER IF NOT EXISTS reviews_fts_delete AFTER DELETE ON reviews BEGIN
+    INSERT INTO reviews_fts (reviews_fts, rowid, content, replyContent)
+    VALUES ('delete', old.rowid, old.content, old.replyContent);
+END;
+CREATE TRIGGER IF NOT EXISTS reviews_fts_update AFTER UPDATE OF content, replyContent ON reviews
+WHEN old.content IS NOT new.content OR old.replyContent IS NOT new.replyContent BEGIN
+    INSERT INTO reviews_fts (reviews_fts, rowid, content, replyContent)
+    VALUES ('delete', old.rowid, old.content, old.replyContent);
+    INSERT INTO reviews_fts (rowid, content, replyContent)
+    VALUES (new.rowid, new.content, new.replyContent);
+END;
+"""
+
+# Ranking of search results: 'relevance' (BM25) or 'newest'
+SEARCH_ORDER = {
+    'relevance': 'bm25(reviews_fts)',
+    'newest': 'r.at DESC',
+}
+
+# A quoted phrase, or a bare word
+QUERY_TOKEN = re.compile(r'"([^"]*)"?|(\S+)')
+
+QUERY_OPERATORS = ('AND', 'OR', 'NOT')
+
+
+def _to_db(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def _from_db(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def match_query(text):
+    """Translate a search query into an FTS5 MATCH expression.
+
+    Words and "quoted phrases" are matched as given, a trailing * matches a
+    prefix, and uppercase AND, OR and NOT combine them; terms are implicitly
+    ANDed. Every other character is taken literally, so punctuation in the
+    query cannot break the expression.
+    """
+    parts = []
+    for phrase, word in QUERY_TOKEN.findall(text):
+        if word in QUERY_OPERATORS:
+            parts.append(word)
+            continue
+        term, prefix = (word[:-1], True) if word.endswith('*') else (phrase or word, False)
+        if term.strip():
+            parts.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+class ReviewStore:
+    """On-disk SQLite store of every review fetched from Google Play.
+
+    Reviews are deduplicated by reviewId per app/lang/country and indexed by
+    timestamp. For each locale the store also records the contiguous window
+    [oldest_at, synced_at] that a newest-first scrape has fully covered, so
+    date-range queries inside that window can be answered without the network.
+
+    Review and reply text is also indexed for full-text search as reviews
+    are stored. The index refers to reviews by rowid, so it must be rebuilt
+    (see rebuild_search_index) if the database is ever VACUUMed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            indexed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reviews_fts'"
+            ).fetchone()
+            conn.executescript(SEARCH_SCHEMA)
+        if not indexed:
+            # Stores created before the index existed are indexed once
+            self.rebuild_search_index()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_coverage(self, app_id, lang, country):
+        """Return the covered window for a locale as a dict, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT oldest_at, synced_at FROM coverage '
+                'WHERE app_id = ? AND lang = ? AND country = ?',
+                (app_id, lang, country)
+            ).fetchone()
+            if row is None:
+                return None
+            newest = conn.execute(
+                'SELECT MAX(at) FROM reviews WHERE app_id = ? AND lang = ? AND country = ?',
+                (app_id, lang, country)
+            ).fetchone()
+        return {
+            'oldest_at': _from_db(row[0]),
+            'synced_at': _from_db(row[1]),
+            'newest_at': _from_db(newest[0]),
+        }
+
+    def count_reviews(self, app_id, lang, country, from_date=None, to_date=None):
+        """Count stored reviews for a locale inside an optional date range"""
+        query, params = self._range_query('SELECT COUNT(*)', app_id, lang, country, from_date, to_date)
+        with self._connect() as conn:
+            return conn.execute(query, params).fetchone()[0]
+
+    def add_reviews(self, app_id, lang, country, page):
+        """Insert or refresh a page of reviews"""
+        rows = [
+            (app_id, lang, country) + tuple(_to_db(review.get(field)) for field in REVIEW_FIELDS)
+            for review in page
+        ]
+        placeholders = ', '.join('?' * (len(REVIEW_FIELDS) + 3))
+        # An upsert keeps the rowid, and the search index is only touched when the text changed
+        updates = ', '.join(f'{field} = excluded.{field}' for field in REVIEW_FIELDS[1:])
+        with metrics.timed('store_write'), self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO reviews (app_id, lang, country, {', '.join(REVIEW_FIELDS)}) "
+                f"VALUES ({placeholders}) "
+                f"ON CONFLICT (app_id, lang, country, reviewId) DO UPDATE SET {updates}",
+                rows
+            )
+
+    def record_pages(self, app_id, lang, country, pages):
+        """Store pages from a newest-first scrape as they pass through.
+
+        Whatever prefix of the scrape has been consumed when the generator
+        finishes (or is closed early) is a contiguous window ending at the
+        time the scrape started, and is merged into the locale's coverage.
+        """
+        started_at = datetime.now()
+        oldest_at = None
+        try:
+            for page in pages:
+                self.add_reviews(app_id, lang, country, page)
+                page_times = [review['at'] for review in page if review.get('at') is not None]
+                if page_times:
+                    oldest_at = min(page_times + ([oldest_at] if oldest_at else []))
+                yield page
+        finally:
+            if oldest_at is not None:
+                self._merge_coverage(app_id, lang, country, oldest_at, started_at)
+
+    def _merge_coverage(self, app_id, lang, country, oldest_at, synced_at):
+        with self._lock:
+            coverage = self.get_coverage(app_id, lang, country)
+            if coverage is not None:
+                if oldest_at > coverage['synced_at']:
+                    # The new window does not reach the old one; keep the old window
+                    return
+                oldest_at = min(oldest_at, coverage['oldest_at'])
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO coverage (app_id, lang, country, oldest_at, synced_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (app_id, lang, country, _to_db(oldest_at), _to_db(synced_at))
+                )
+
+    def iter_pages(self, app_id, lang, country, from_date=None, to_date=None, before=None, page_size=200):
+        """Yield stored reviews for a locale, newest first, in pages.
+
+        from_date and to_date are inclusive bounds; before is an exclusive
+        upper bound on the review timestamp.
+        """
+        query, params = self._range_query(
+            f"SELECT {', '.join(REVIEW_FIELDS)}", app_id, lang, country, from_date, to_date
+        )
+        if before is not None:
+            query += ' AND at < ?'
+            params.append(_to_db(before))
+        query += ' ORDER BY at DESC'
+
+        with self._connect() as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                with metrics.timed('store_read'):
+                    rows = cursor.fetchmany(page_size)
+                    page = []
+                    for row in rows:
+                        review = dict(zip(REVIEW_FIELDS, row))
+                        for field in DATETIME_FIELDS:
+                            review[field] = _from_db(review[field])
+                        page.append(review)
+                if not page:
+                    break
+                yield page
+
+    def search(self, query, app_id=None, lang=None, country=None, from_date=None, to_date=None,
+               min_score=None, max_score=None, order='relevance', limit=20, offset=0):
+        """Return stored reviews whose text matches a search query, best matches first.
+
+        The query uses the syntax of match_query. Filters that are None are
+        not applied; from_date and to_date are inclusive bounds. One more row
+        than `limit` is fetched, so the second value returned tells whether
+        there is another page. Each review carries its app_id, lang and
+        country and a `snippet` of the matching text, with matches in **bold**.
+        Raises ValueError if the query is empty or invalid.
+        """
+        expression = match_query(query)
+        if not expression:
+            raise ValueError('The search query has no terms')
+
+        sql = (
+            f"SELECT r.app_id, r.lang, r.country, {', '.join('r.' + field for field in REVIEW_FIELDS)}, "
+            "snippet(reviews_fts, -1, '**', '**', '…', 16) "
+            "FROM reviews_fts JOIN reviews r ON r.rowid = reviews_fts.rowid "
+            "WHERE reviews_fts MATCH ?"
+        )
+        params = [expression]
+        for clause, value in (
+            ('r.app_id = ?', app_id),
+            ('r.lang = ?', lang),
+            ('r.country = ?', country),
+            ('r.at >= ?', _to_db(from_date)),
+            ('r.at <= ?', _to_db(to_date)),
+            ('r.score >= ?', min_score),
+            ('r.score <= ?', max_score),
+        ):
+            if value is not None:
+                sql += f' AND {clause}'
+                params.append(value)
+        sql += f' ORDER BY {SEARCH_ORDER[order]}, r.rowid LIMIT ? OFFSET ?'
+        params += [limit + 1, offset]
+
+        columns = ['app_id', 'lang', 'country'] + REVIEW_FIELDS + ['snippet']
+        with metrics.timed('search'), self._connect() as conn:
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                # Dangling operators are the only way left to write an invalid expression
+                if 'fts5' in str(e):
+                    raise ValueError(f'Invalid search query: {query}') from e
+                raise
+
+        results = []
+        for row in rows[:limit]:
+            review = dict(zip(columns, row))
+            for field in DATETIME_FIELDS:
+                review[field] = _from_db(review[field])
+            results.append(review)
+        return results, len(rows) > limit
+
+    def rebuild_search_index(self):
+        """Reindex the text of every stored review"""
+        with self._connect() as conn:
+            conn.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _range_query(select, app_id, lang, country, from_date, to_date):
+        query = f'{select} FROM reviews WHERE app_id = ? AND lang = ? AND country = ? AND at IS NOT NULL'
+        params = [app_id, lang, country]
+        if from_date is not None:
+            query += ' AND at >= ?'
+            params.append(_to_db(from_date))
+        if to_date is not None:
+            query += ' AND at <= ?'
+            params.append(_to_db(to_date))
+        return query, params
@@ -0,0 +1,18 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(review):
+    """Build an opaque sync cursor pointing at a review"""
+    payload = json.dumps({"at": review['at'].isoformat(), "id": review['reviewId']})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (at, reviewId) a sync cursor points at, raising ValueError if invalid"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload['at']), payload['id']
+    except (TypeError, KeyError, json.JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
@@ -7,16 +7,26 @@ import sys
 import os
 from datetime import datetime, timedelta
 
+# app.py listens on port 8080; set API_URL to test another deployment
+API_URL = os.environ.get("API_URL", "http://localhost:8080")
+
+# Set API_OFFLINE=1 to start the server against the recorded scraper stub
+API_OFFLINE = os.environ.get("API_OFFLINE") == "1"
+
 def test_api():
     # Check if the API is already running
     try:
-        response = requests.get("http://localhost:5000")
+        response = requests.get(API_URL)
         print("API is already running")
     except requests.exceptions.ConnectionError:
         # Start the API server
         print("Starting API server...")
+        if API_OFFLINE:
+            command = ["python", "benchmarks/stub_server.py", "--port", "8080"]
+        else:
+            command = ["python", "app.py"]
         api_process = subprocess.Popen(
-            ["python", "app.py"],
+            command,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
@@ -30,7 +40,7 @@ def test_api():
     # Test 1: Basic request
     print(f"\n--- Test 1: Basic Request ---")
     print(f"Fetching reviews for {app_id}...")
-    url = "http://localhost:5000/api/reviews"
+    url = f"{API_URL}/api/reviews"
     params = {
         "app_id": app_id,
         "count": 20,  # Limit to 20 reviews for the test
@@ -103,5 +113,25 @@ def test_api():
         print(f"Error: {response.status_code}")
         print(response.text)
 
+    # Test 3: Search the reviews fetched by the previous tests
+    print(f"\n--- Test 3: Search ---")
+    search_params = {
+        "q": "game",
+        "app_id": app_id,
+        "limit": 5
+    }
+
+    print(f"Searching stored reviews for '{search_params['q']}'...")
+    response = requests.get(f"{API_URL}/api/reviews/search", params=search_params)
+
+    if response.status_code == 200:
+        results = response.json()["results"]
+        print(f"Matching reviews on the first page: {len(results)}")
+        for review in results:
+            print(f"- [{review['score']}] {review['snippet']}")
+    else:
+        print(f"Error: {response.status_code}")
+        print(response.text)
+
 if __name__ == "__main__":
     test_api()
@@ -0,0 +1,306 @@
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+pytest.importorskip('google_play_scraper')
+
+# The app reads its settings on import: small upstream pages, and no store or
+# cache unless a test sets one up
+os.environ['REVIEWS_PAGE_SIZE'] = '10'
+os.environ['REVIEW_STORE_PATH'] = ''
+os.environ['RESPONSE_CACHE_SIZE'] = '0'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import app as api  # noqa: E402
+from review_store import ReviewStore  # noqa: E402
+from scraper_stub import StubScraper  # noqa: E402
+
+APP_ID = 'org.example.app'
+NEWEST = datetime(2024, 3, 10, 12, 0)
+INTERVAL = timedelta(minutes=7)
+
+
+class Scraper(StubScraper):
+    """A stub whose review ids follow their time, so they stay put when newer reviews arrive"""
+
+    def review(self, app_id, index):
+        review = super().review(app_id, index)
+        review['reviewId'] = f"stub:{app_id}:{review['at']:%Y%m%d%H%M}"
+        return review
+
+
+@pytest.fixture
+def scraper(monkeypatch):
+    scraper = Scraper(total=1000, newest=NEWEST, interval=INTERVAL)
+    monkeypatch.setattr(api, 'reviews', scraper.reviews)
+    return scraper
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ReviewStore(str(tmp_path / 'reviews.db'))
+    monkeypatch.setattr(api, 'review_store', store)
+    return store
+
+
+@pytest.fixture
+def client():
+    return api.app.test_client()
+
+
+def get_reviews(client, **params):
+    response = client.get('/api/reviews', query_string={'app_id': APP_ID, 'format': 'ndjson', **params})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def times(rows):
+    return [datetime.fromisoformat(row['at']) for row in rows]
+
+
+def test_count_caps_the_reviews_and_the_pages_fetched(client, scraper):
+    rows = get_reviews(client, count=25)
+
+    assert times(rows) == [NEWEST - INTERVAL * i for i in range(25)]
+    assert scraper.pages_served == 3
+
+
+def test_a_small_count_sizes_the_upstream_page(client, scraper):
+    assert len(get_reviews(client, count=4)) == 4
+    assert scraper.pages_served == 1
+
+
+def test_paging_stops_at_the_first_review_before_from_date(client, scraper):
+    rows = get_reviews(client, from_date='2024-03-10')
+
+    # Reviews 0-102 are from March 10th; review 103 is on the page that ends the scrape
+    assert len(rows) == 103
+    assert min(times(rows)) >= datetime(2024, 3, 10)
+    assert scraper.pages_served == 11
+
+
+def test_reviews_after_to_date_are_skipped(client, scraper):
+    rows = get_reviews(client, to_date='2024-03-09', count=5)
+
+    assert times(rows) == [NEWEST - INTERVAL * i for i in range(103, 108)]
+
+
+def test_a_cold_store_scrapes_and_records_coverage(client, scraper, store):
+    rows = get_reviews(client, count=25)
+
+    assert len(rows) == 25
+    assert scraper.pages_served == 3
+    coverage = store.get_coverage(APP_ID, 'en', 'us')
+    assert coverage['newest_at'] == NEWEST
+    assert coverage['oldest_at'] <= NEWEST - INTERVAL * 24
+    assert store.count_reviews(APP_ID, 'en', 'us') >= 25
+
+
+def test_a_warm_store_serves_without_scraping(client, scraper, store):
+    cold = get_reviews(client, count=25)
+    pages = scraper.pages_served
+
+    assert get_reviews(client, count=25) == cold
+    assert get_reviews(client, count=25, to_date='2024-03-10') == cold
+    assert scraper.pages_served == pages
+
+
+def test_a_stale_store_fetches_only_the_gap(client, scraper, store, monkeypatch):
+    get_reviews(client, count=30)
+    pages = scraper.pages_served
+
+    # Six reviews later, the store is older than REVIEW_STORE_MAX_AGE
+    monkeypatch.setattr(api, 'REVIEW_STORE_MAX_AGE', 0)
+    scraper.newest = NEWEST + INTERVAL * 6
+    rows = get_reviews(client, count=25)
+
+    # The first upstream page reaches the newest stored review; the rest comes from the store
+    assert scraper.pages_served == pages + 1
+    assert times(rows) == [scraper.newest - INTERVAL * i for i in range(25)]
+    assert store.get_coverage(APP_ID, 'en', 'us')['newest_at'] == scraper.newest
+
+
+def test_a_from_date_past_the_stored_window_scrapes_it_all(client, scraper, store):
+    get_reviews(client, count=10)
+    assert scraper.pages_served == 1
+
+    rows = get_reviews(client, from_date='2024-03-10')
+
+    assert len(rows) == 103
+    assert scraper.pages_served == 1 + 11
+    assert store.get_coverage(APP_ID, 'en', 'us')['oldest_at'] < datetime(2024, 3, 10)
+
+    # Now covered: the same window is served from the store
+    assert get_reviews(client, from_date='2024-03-10') == rows
+    assert scraper.pages_served == 12
+
+
+def post_batch(client, body):
+    response = client.post('/api/reviews/batch', json=body)
+    assert response.status_code == 200
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_a_failing_batch_target_gets_an_error_row(client, scraper, monkeypatch):
+    def reviews(app_id, **options):
+        if app_id == 'org.example.broken':
+            raise RuntimeError('Upstream failed')
+        return scraper.reviews(app_id, **options)
+
+    monkeypatch.setattr(api, 'reviews', reviews)
+    rows = post_batch(client, {
+        'targets': [
+            {'app_id': 'org.example.a'},
+            {'app_id': 'org.example.broken'},
+            {'app_id': 'org.example.b', 'lang': 'de'},
+        ],
+        'count': 15,
+    })
+
+    by_app = {}
+    for row in rows:
+        by_app.setdefault(row['app_id'], []).append(row)
+    assert len(by_app['org.example.a']) == 15
+    assert {row['lang'] for row in by_app['org.example.b']} == {'de'}
+    assert len(by_app['org.example.b']) == 15
+    assert [(row['error'], row['reviewId']) for row in by_app['org.example.broken']] == [('Upstream failed', '')]
+    assert all(row['error'] == '' for row in by_app['org.example.a'])
+
+
+def test_batch_concurrency_is_clamped(client, scraper, monkeypatch):
+    requested = []
+    iter_batch_pages = api.iter_batch_pages
+
+    def spy(targets, count, from_date, to_date, concurrency):
+        requested.append(concurrency)
+        return iter_batch_pages(targets, count, from_date, to_date, concurrency)
+
+    monkeypatch.setattr(api, 'iter_batch_pages', spy)
+    monkeypatch.setattr(api, 'BATCH_MAX_CONCURRENCY', 2)
+    targets = [{'app_id': f'org.example.{i}'} for i in range(4)]
+
+    assert len(post_batch(client, {'targets': targets, 'count': 3, 'concurrency': 50})) == 12
+    post_batch(client, {'targets': targets[:1], 'count': 3})
+    post_batch(client, {'targets': targets, 'count': 3, 'concurrency': 0})
+    assert requested == [2, 1, 1]
+
+
+def test_batch_fetches_run_on_at_most_concurrency_threads(scraper, monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def reviews(app_id, **options):
+        with lock:
+            running.append(app_id)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(app_id)
+        return scraper.reviews(app_id, **options)
+
+    monkeypatch.setattr(api, 'reviews', reviews)
+    targets = [{'app_id': f'org.example.{i}', 'lang': 'en', 'country': 'us'} for i in range(6)]
+    pages = list(api.iter_batch_pages(targets, 5, None, None, 2))
+
+    assert sum(len(page) for page in pages) == 30
+    assert max(peak) <= 2
+
+
+@pytest.mark.parametrize('body, kwargs', [
+    (None, {'data': 'not json', 'content_type': 'application/json'}),
+    (None, {'data': 'targets=a', 'content_type': 'application/x-www-form-urlencoded'}),
+    ({'targets': []}, {}),
+    ({'targets': 'org.example.app'}, {}),
+    ({'targets': [{'lang': 'en'}]}, {}),
+    ({'targets': ['org.example.app']}, {}),
+    ({'targets': [{'app_id': APP_ID}], 'count': 'ten'}, {}),
+    ({'targets': [{'app_id': APP_ID}], 'concurrency': [1]}, {}),
+    ({'targets': [{'app_id': APP_ID}], 'from_date': '10/03/2024'}, {}),
+])
+def test_bad_batch_requests_are_refused(client, scraper, body, kwargs):
+    if body is not None:
+        kwargs = {'json': body}
+    response = client.post('/api/reviews/batch', **kwargs)
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    assert scraper.pages_served == 0
+
+
+def test_batches_with_too_many_targets_are_refused(client, monkeypatch):
+    monkeypatch.setattr(api, 'BATCH_MAX_TARGETS', 2)
+    response = client.post('/api/reviews/batch', json={'targets': [{'app_id': APP_ID}] * 3})
+
+    assert response.status_code == 400
+
+
+STATS_COLUMNS = ['reviewId', 'content', 'score', 'thumbsUpCount', 'reviewCreatedVersion', 'at']
+
+
+def test_stats_of_no_reviews(client, scraper):
+    pytest.importorskip('pandas')
+    scraper.total = 0
+
+    response = client.get('/api/reviews/stats', query_string={'app_id': APP_ID})
+
+    assert response.status_code == 200
+    stats = response.get_json()
+    assert stats['total_reviews'] == 0
+    assert stats['average_score'] is None
+    assert stats['score_distribution'] == {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}
+    assert stats['daily_volume'] == stats['weekly_volume'] == stats['versions'] == stats['top_reviews'] == []
+
+
+def test_stats_summarise_the_reviews(client, scraper):
+    pytest.importorskip('pandas')
+
+    stats = client.get('/api/reviews/stats', query_string={'app_id': APP_ID, 'count': 30, 'top': 3}).get_json()
+
+    assert stats['total_reviews'] == 30
+    assert sum(stats['score_distribution'].values()) == 30
+    assert sum(day['count'] for day in stats['daily_volume']) == 30
+    assert len(stats['top_reviews']) == 3
+    thumbs = [review['thumbsUpCount'] for review in stats['top_reviews']]
+    assert thumbs == sorted(thumbs, reverse=True)
+
+
+def test_stats_leave_out_missing_scores_and_dates():
+    pd = pytest.importorskip('pandas')
+    rows = [
+        {'reviewId': 'a', 'content': 'No rating', 'score': None, 'thumbsUpCount': 9,
+         'reviewCreatedVersion': None, 'at': None},
+        {'reviewId': 'b', 'content': 'Good', 'score': 4, 'thumbsUpCount': None,
+         'reviewCreatedVersion': '1.0', 'at': datetime(2024, 3, 1, 12)},
+        {'reviewId': 'c', 'content': 'Fine', 'score': 3, 'thumbsUpCount': 1,
+         'reviewCreatedVersion': '1.0', 'at': datetime(2024, 3, 1, 18)},
+    ]
+
+    stats = api.compute_review_stats(pd.DataFrame(rows, columns=STATS_COLUMNS), 5)
+
+    assert stats['total_reviews'] == 3
+    assert stats['average_score'] == 3.5
+    assert stats['score_distribution'] == {'1': 0, '2': 0, '3': 1, '4': 1, '5': 0}
+    assert stats['daily_volume'] == [{'date': '2024-03-01', 'count': 2, 'average_score': 3.5}]
+    assert {version['version']: version['average_score'] for version in stats['versions']} == {
+        '1.0': 3.5, 'unknown': None,
+    }
+    assert stats['top_reviews'][0] == {
+        'reviewId': 'a', 'content': 'No rating', 'score': None, 'thumbsUpCount': 9, 'at': None,
+    }
+    json.dumps(stats, allow_nan=False)
+
+    stats = api.compute_review_stats(pd.DataFrame(rows[:1], columns=STATS_COLUMNS), 5)
+    assert stats['average_score'] is None
+    assert stats['daily_volume'] == []
+    json.dumps(stats, allow_nan=False)
@@ -0,0 +1,110 @@
+import csv
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime
+
+import pytest
+
+from formats import compress_stream, generate_csv, generate_ndjson, negotiate_format
+from review_store import REVIEW_FIELDS
+
+PAGES = [
+    [
+        {'reviewId': 'a', 'content': 'Great, "really" great', 'score': 5, 'at': datetime(2024, 3, 1, 12, 30),
+         'userName': 'Someone', 'userImage': 'https://example.com/a.png'},
+        {'reviewId': 'b', 'content': 'Two\nlines', 'score': 2, 'at': None},
+    ],
+    [{'reviewId': 'c', 'content': 'Ünïcödé', 'score': 4, 'at': datetime(2024, 2, 1)}],
+]
+
+
+class Accept:
+    """The part of an Accept header parser negotiate_format uses"""
+
+    def __init__(self, mimetype=None):
+        self.mimetype = mimetype
+
+    def best_match(self, mimetypes, default=None):
+        return self.mimetype if self.mimetype in mimetypes else default
+
+
+def test_csv_has_a_header_and_one_chunk_per_page():
+    chunks = list(generate_csv(PAGES))
+
+    assert len(chunks) == 2
+    rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+    assert list(rows[0]) == REVIEW_FIELDS
+    assert [row['reviewId'] for row in rows] == ['a', 'b', 'c']
+    assert rows[0]['content'] == 'Great, "really" great'
+    assert rows[1]['content'] == 'Two\nlines'
+    assert rows[0]['at'] == '2024-03-01 12:30:00'
+    assert rows[1]['at'] == ''
+
+
+def test_csv_never_writes_private_fields():
+    text = ''.join(generate_csv(PAGES))
+
+    assert 'userName' not in text
+    assert 'Someone' not in text
+
+
+def test_csv_of_no_pages_is_just_the_header():
+    assert ''.join(generate_csv([])) == ','.join(REVIEW_FIELDS) + '\n'
+
+
+def test_ndjson_writes_one_object_per_review():
+    lines = ''.join(generate_ndjson(PAGES)).splitlines()
+
+    reviews = [json.loads(line) for line in lines]
+    assert [review['reviewId'] for review in reviews] == ['a', 'b', 'c']
+    assert reviews[0]['at'] == '2024-03-01T12:30:00'
+    assert 'userName' not in reviews[0]
+    assert reviews[2]['content'] == 'Ünïcödé'
+
+
+@pytest.mark.parametrize('encoding, decompress', [
+    ('gzip', gzip.decompress),
+    ('deflate', zlib.decompress),
+])
+def test_compressed_streams_decompress_to_the_input(encoding, decompress):
+    chunks = ['first chunk\n', b'second chunk\n', '']
+
+    assert decompress(b''.join(compress_stream(chunks, encoding))) == b'first chunk\nsecond chunk\n'
+
+
+def test_compression_flushes_every_chunk():
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    stream = compress_stream(['a' * 1000, 'b' * 1000], 'gzip')
+
+    # Each chunk can be decoded as soon as it arrives
+    assert decompressor.decompress(next(stream)) == b'a' * 1000
+    assert decompressor.decompress(next(stream)) == b'b' * 1000
+
+
+def test_the_format_parameter_overrides_accept():
+    assert negotiate_format('ndjson', Accept('application/vnd.apache.parquet')) == 'ndjson'
+    assert negotiate_format('xml', Accept()) is None
+
+
+def test_accept_picks_the_format_and_falls_back_to_csv():
+    assert negotiate_format(None, Accept('application/vnd.apache.arrow.stream')) == 'arrow'
+    assert negotiate_format(None, Accept('application/xml')) == 'csv'
+    assert negotiate_format(None, Accept()) == 'csv'
+
+
+def test_arrow_and_parquet_round_trip():
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    from formats import generate_arrow, generate_parquet
+
+    pages = [[{key: value for key, value in review.items() if key in REVIEW_FIELDS} for review in page]
+             for page in PAGES]
+    table = pa.ipc.open_stream(b''.join(generate_arrow(pages))).read_all()
+    assert table.column('reviewId').to_pylist() == ['a', 'b', 'c']
+
+    table = pq.read_table(io.BytesIO(b''.join(generate_parquet(pages))))
+    assert table.num_rows == 3
+    assert table.column('at').to_pylist()[0] == datetime(2024, 3, 1, 12, 30)
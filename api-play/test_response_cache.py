@@ -0,0 +1,151 @@
+import gc
+import threading
+import time
+
+from response_cache import ResponseCache
+
+
+class Fetcher:
+    """Counts fetches and returns the given pages, optionally blocking before each one"""
+
+    def __init__(self, pages, gate=None):
+        self.pages = pages
+        self.gate = gate
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self._iterate()
+
+    def _iterate(self):
+        for page in self.pages:
+            if self.gate is not None:
+                self.gate.wait()
+            yield page
+
+
+def test_a_hit_is_served_without_fetching():
+    cache = ResponseCache()
+    fetch = Fetcher([[1, 2], [3]])
+
+    assert list(cache.get_pages('key', fetch)) == [[1, 2], [3]]
+    assert list(cache.get_pages('key', fetch)) == [[1, 2], [3]]
+
+    assert fetch.calls == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ResponseCache(ttl=0.05)
+    fetch = Fetcher([[1]])
+
+    list(cache.get_pages('key', fetch))
+    time.sleep(0.1)
+    list(cache.get_pages('key', fetch))
+
+    assert fetch.calls == 2
+    assert cache.stats()['expirations'] == 1
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    fetches = {key: Fetcher([[key]]) for key in 'abc'}
+
+    list(cache.get_pages('a', fetches['a']))
+    list(cache.get_pages('b', fetches['b']))
+    list(cache.get_pages('a', fetches['a']))
+    list(cache.get_pages('c', fetches['c']))
+    list(cache.get_pages('a', fetches['a']))
+    list(cache.get_pages('b', fetches['b']))
+
+    assert fetches['a'].calls == 1
+    assert fetches['b'].calls == 2
+    assert cache.stats()['evictions'] == 2
+
+
+def test_results_over_max_rows_are_streamed_but_not_cached():
+    cache = ResponseCache(max_rows=3)
+    fetch = Fetcher([[1, 2], [3, 4]])
+
+    assert list(cache.get_pages('key', fetch)) == [[1, 2], [3, 4]]
+    assert list(cache.get_pages('key', fetch)) == [[1, 2], [3, 4]]
+
+    assert fetch.calls == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = ResponseCache()
+    gate = threading.Event()
+    fetch = Fetcher([[1], [2]], gate)
+    leader = cache.get_pages('key', fetch)
+
+    results = []
+    follower = threading.Thread(target=lambda: results.append(list(cache.get_pages('key', fetch))))
+    follower.start()
+    time.sleep(0.05)
+    gate.set()
+    assert list(leader) == [[1], [2]]
+    follower.join(timeout=5)
+
+    assert results == [[[1], [2]]]
+    assert fetch.calls == 1
+    assert cache.stats()['coalesced'] == 1
+
+
+def test_waiters_stop_waiting_once_the_result_is_too_large():
+    cache = ResponseCache(max_rows=1)
+    fetch = Fetcher([[1, 2], [3]])
+    leader = cache.get_pages('key', fetch)
+    # The leader has fetched past max_rows but its client has not read further
+    assert next(leader) == [1, 2]
+
+    start = time.monotonic()
+    assert list(cache.get_pages('key', fetch)) == [[1, 2], [3]]
+
+    assert time.monotonic() - start < 1
+    assert fetch.calls == 2
+
+
+def test_waiters_fetch_themselves_after_the_wait_timeout():
+    cache = ResponseCache(wait_timeout=0.05)
+    fetch = Fetcher([[1]])
+    leader = cache.get_pages('key', Fetcher([[1]], threading.Event()))
+
+    assert list(cache.get_pages('key', fetch)) == [[1]]
+    assert fetch.calls == 1
+    leader.close()
+
+
+def test_a_leader_that_is_never_iterated_does_not_block_the_key():
+    cache = ResponseCache(wait_timeout=5)
+    leader = cache.get_pages('key', Fetcher([[1]]))
+    del leader
+    gc.collect()
+
+    start = time.monotonic()
+    fetch = Fetcher([[2]])
+    assert list(cache.get_pages('key', fetch)) == [[2]]
+
+    assert time.monotonic() - start < 1
+    assert fetch.calls == 1
+
+
+def test_a_failed_fetch_is_not_cached_and_releases_the_key():
+    cache = ResponseCache(wait_timeout=5)
+
+    def failing():
+        yield [1]
+        raise RuntimeError('upstream failed')
+
+    pages = cache.get_pages('key', failing)
+    assert next(pages) == [1]
+    try:
+        next(pages)
+    except RuntimeError:
+        pass
+
+    fetch = Fetcher([[2]])
+    assert list(cache.get_pages('key', fetch)) == [[2]]
+    assert fetch.calls == 1
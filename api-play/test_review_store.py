@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from review_store import ReviewStore, match_query
+
+APP = ('org.example.app', 'en', 'us')
+
+
+def review(review_id, at, content='Great game'):
+    return {'reviewId': review_id, 'content': content, 'score': 5, 'thumbsUpCount': 0, 'at': at}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ReviewStore(str(tmp_path / 'reviews.db'))
+
+
+def test_record_pages_stores_reviews_and_covers_the_scrape(store):
+    pages = [
+        [review('a', datetime(2024, 3, 3)), review('b', datetime(2024, 3, 2))],
+        [review('c', datetime(2024, 3, 1))],
+    ]
+    before = datetime.now()
+
+    assert list(store.record_pages(*APP, pages)) == pages
+
+    coverage = store.get_coverage(*APP)
+    assert coverage['oldest_at'] == datetime(2024, 3, 1)
+    assert coverage['newest_at'] == datetime(2024, 3, 3)
+    assert coverage['synced_at'] >= before
+    assert store.count_reviews(*APP) == 3
+
+
+def test_closing_a_scrape_early_covers_only_what_was_consumed(store):
+    pages = [[review('a', datetime(2024, 3, 3))], [review('b', datetime(2024, 3, 1))]]
+
+    recorder = store.record_pages(*APP, pages)
+    next(recorder)
+    recorder.close()
+
+    assert store.get_coverage(*APP)['oldest_at'] == datetime(2024, 3, 3)
+    assert store.count_reviews(*APP) == 1
+
+
+def test_overlapping_windows_are_merged(store):
+    store._merge_coverage(*APP, datetime(2024, 1, 1), datetime(2024, 2, 1))
+    store._merge_coverage(*APP, datetime(2024, 1, 15), datetime(2024, 3, 1))
+
+    coverage = store.get_coverage(*APP)
+    assert coverage['oldest_at'] == datetime(2024, 1, 1)
+    assert coverage['synced_at'] == datetime(2024, 3, 1)
+
+
+def test_a_window_that_leaves_a_gap_keeps_the_old_one(store):
+    store._merge_coverage(*APP, datetime(2024, 1, 1), datetime(2024, 2, 1))
+    store._merge_coverage(*APP, datetime(2024, 2, 15), datetime(2024, 3, 1))
+
+    coverage = store.get_coverage(*APP)
+    assert coverage['oldest_at'] == datetime(2024, 1, 1)
+    assert coverage['synced_at'] == datetime(2024, 2, 1)
+
+
+def test_coverage_is_kept_per_locale(store):
+    list(store.record_pages(*APP, [[review('a', datetime(2024, 3, 3))]]))
+
+    assert store.get_coverage('org.example.app', 'fr', 'fr') is None
+
+
+def test_iter_pages_filters_by_date_newest_first(store):
+    start = datetime(2024, 3, 1)
+    store.add_reviews(*APP, [review(str(day), start + timedelta(days=day)) for day in range(10)])
+
+    pages = list(store.iter_pages(
+        *APP, from_date=datetime(2024, 3, 3), to_date=datetime(2024, 3, 6), before=datetime(2024, 3, 6), page_size=2
+    ))
+
+    assert [len(page) for page in pages] == [2, 1]
+    assert [r['reviewId'] for page in pages for r in page] == ['4', '3', '2']
+
+
+def test_readding_a_review_updates_it_in_place(store):
+    store.add_reviews(*APP, [review('a', datetime(2024, 3, 1), 'Crashes a lot')])
+    store.add_reviews(*APP, [review('a', datetime(2024, 3, 1), 'Fixed now')])
+
+    assert store.count_reviews(*APP) == 1
+    assert [r['content'] for page in store.iter_pages(*APP) for r in page] == ['Fixed now']
+
+
+@pytest.mark.parametrize('query, expression', [
+    ('crash login', '"crash" "login"'),
+    ('"keeps crashing" login', '"keeps crashing" "login"'),
+    ('crash*', '"crash"*'),
+    ('crash OR freeze NOT login', '"crash" OR "freeze" NOT "login"'),
+    ('crash or freeze', '"crash" "or" "freeze"'),
+    ('can\'t log-in (again)', '"can\'t" "log-in" "(again)"'),
+    ('say "hi', '"say" "hi"'),
+    ('a"b', '"a""b"'),
+    ('', ''),
+    ('"" *', ''),
+])
+def test_match_query_quotes_every_term(query, expression):
+    assert match_query(query) == expression
+
+
+def test_search_finds_matching_reviews_with_a_snippet(store):
+    store.add_reviews(*APP, [
+        review('a', datetime(2024, 3, 2), 'Crashes on login every time'),
+        review('b', datetime(2024, 3, 1), 'Great game, no crashes'),
+        review('c', datetime(2024, 2, 1), 'Too many ads'),
+    ])
+
+    results, has_more = store.search('crash*')
+
+    assert {r['reviewId'] for r in results} == {'a', 'b'}
+    assert not has_more
+    a = next(r for r in results if r['reviewId'] == 'a')
+    assert a['snippet'] == '**Crashes** on login every time'
+    assert (a['app_id'], a['lang'], a['country']) == APP
+    assert a['at'] == datetime(2024, 3, 2)
+
+
+def test_search_applies_the_filters(store):
+    store.add_reviews(*APP, [
+        review('a', datetime(2024, 3, 2), 'Crashes on login'),
+        dict(review('b', datetime(2024, 3, 1), 'Crashes sometimes'), score=2),
+    ])
+    store.add_reviews('org.example.other', 'en', 'us', [review('c', datetime(2024, 3, 1), 'Crashes')])
+
+    def ids(**filters):
+        return [r['reviewId'] for r in store.search('crashes', order='newest', **filters)[0]]
+
+    assert ids() == ['a', 'b', 'c']
+    assert ids(app_id=APP[0]) == ['a', 'b']
+    assert ids(max_score=3) == ['b']
+    assert ids(from_date=datetime(2024, 3, 2)) == ['a']
+    assert ids(to_date=datetime(2024, 3, 1)) == ['b', 'c']
+    assert ids(country='gb') == []
+
+
+def test_search_pages_tell_whether_there_is_more(store):
+    store.add_reviews(*APP, [review(str(day), datetime(2024, 3, day), 'Crashes') for day in range(1, 6)])
+
+    first, has_more = store.search('crashes', order='newest', limit=3)
+    assert [r['reviewId'] for r in first] == ['5', '4', '3']
+    assert has_more
+
+    rest, has_more = store.search('crashes', order='newest', limit=3, offset=3)
+    assert [r['reviewId'] for r in rest] == ['2', '1']
+    assert not has_more
+
+
+@pytest.mark.parametrize('query', ['', '   ', '""', 'NOT', 'crash AND'])
+def test_empty_or_invalid_queries_raise_value_error(store, query):
+    with pytest.raises(ValueError):
+        store.search(query)
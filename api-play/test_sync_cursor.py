@@ -0,0 +1,32 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+from sync_cursor import decode_cursor, encode_cursor
+
+
+def test_a_cursor_points_back_at_its_review():
+    review = {'reviewId': 'gp:AOqpTOFnRmJB', 'at': datetime(2024, 3, 1, 12, 30, 45)}
+
+    assert decode_cursor(encode_cursor(review)) == (datetime(2024, 3, 1, 12, 30, 45), 'gp:AOqpTOFnRmJB')
+
+
+def test_cursors_are_url_safe_without_padding():
+    cursor = encode_cursor({'reviewId': '???>>>', 'at': datetime(2024, 3, 1)})
+
+    assert '=' not in cursor
+    assert all(c.isalnum() or c in '-_' for c in cursor)
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'not a cursor',
+    base64.urlsafe_b64encode(b'{"id": "a"}').decode(),
+    base64.urlsafe_b64encode(b'{"at": "yesterday", "id": "a"}').decode(),
+    base64.urlsafe_b64encode(b'[1, 2]').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_invalid_cursors_raise_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -1,104 +1,612 @@
 import os
+import posixpath
+import re
+import urllib.parse
 import uuid
-import ffmpeg
-import subprocess
 import tempfile
 import json
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-from google.cloud import storage
-import urllib.parse
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, send_file
+from werkzeug.wsgi import LimitedStream
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from blobstore import LocalStore, ObjectInfo, SignedUrlCache, create_store
+from dedup import DedupCache, HashingReader, stored_digest
+from ingest import IngestFull, IngestSessions, IngestTooLarge, parse_content_range, parse_length
+from jobs import JobQueue, QueueFull
+from scheduler import CoreBudget, EncoderPolicy
+import metrics
+import transcode
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32MB max upload size for form data
 
-BUCKET_NAME = "gdc25-video-bucket"
+BUCKET_NAME = os.environ.get('BUCKET_NAME', "gdc25-video-bucket")
+
+# 'gcs' stores videos in BUCKET_NAME; 'local' keeps them under LOCAL_STORAGE_DIR and serves them itself
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'gcs')
+LOCAL_STORAGE_DIR = os.environ.get('LOCAL_STORAGE_DIR', 'storage')
+
+# Key that signs download URLs of the local backend; random per process when unset
+URL_SIGNING_KEY = os.environ.get('URL_SIGNING_KEY')
+
+# Minutes a download URL stays valid; one URL per video is reused until 5 minutes before it expires
+DOWNLOAD_URL_MINUTES = int(os.environ.get('DOWNLOAD_URL_MINUTES', 30))
+DOWNLOAD_URL_MARGIN = timedelta(minutes=5)
+
+# Objects of at least this many bytes are transferred as parallel chunks
+PARALLEL_TRANSFER_THRESHOLD = int(os.environ.get('PARALLEL_TRANSFER_THRESHOLD', 64 * 1024 * 1024))
+TRANSFER_CHUNK_SIZE = int(os.environ.get('TRANSFER_CHUNK_SIZE', 32 * 1024 * 1024))
+TRANSFER_WORKERS = int(os.environ.get('TRANSFER_WORKERS', 8))
+
+# Cores available to this process; one encode runs per worker
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+# Number of videos transcoded at the same time
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', CPU_COUNT))
+
+# Jobs allowed to wait for a worker before /process answers 503
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', TRANSCODE_WORKERS * 4))
+
+# Seconds a finished job stays visible at /jobs/<id>
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 3600))
+
+# ffmpeg threads per encode, so that concurrent encodes do not oversubscribe the cores
+ENCODE_THREADS = max(1, CPU_COUNT // TRANSCODE_WORKERS)
+
+# x264 presets the scheduler picks from per encode, from best compression to fastest
+ENCODER_PRESETS = os.environ.get('ENCODER_PRESETS', 'slow,medium,fast,faster,veryfast,superfast,ultrafast').split(',')
+
+# Seconds within which the scheduler aims to finish the last queued job
+TARGET_COMPLETION_SECONDS = float(os.environ.get('TARGET_COMPLETION_SECONDS', 300))
+
+# 'streaming' pipes the download through ffmpeg into the upload; 'file' encodes via temporary files
+TRANSCODE_MODE = os.environ.get('TRANSCODE_MODE', 'streaming')
+
+# 'direct' has browsers upload straight to storage; 'ingest' has them send chunks to this
+# server, which starts probing and encoding while the upload arrives
+UPLOAD_MODE = os.environ.get('UPLOAD_MODE', 'direct')
+
+# Size of the chunks browsers send in ingest mode (Cloud Run caps request bodies at 32MB)
+INGEST_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Seconds an ingest upload may stall before it is discarded
+INGEST_IDLE_TIMEOUT = int(os.environ.get('INGEST_IDLE_TIMEOUT', 300))
+
+# Ingest uploads announced or in progress at a time, each spooled to a temporary file
+INGEST_MAX_SESSIONS = int(os.environ.get('INGEST_MAX_SESSIONS', TRANSCODE_WORKERS + MAX_QUEUED_JOBS))
+
+# Largest ingest upload in bytes; spool files live in memory on Cloud Run, so keep
+# INGEST_MAX_SESSIONS uploads of this size within the instance's memory
+MAX_INGEST_BYTES = int(os.environ.get('MAX_INGEST_BYTES', 256 * 1024 * 1024))
+
+# Chunk size for streamed downloads and uploads (uploads need multiples of 256KB)
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Inputs at least this long (seconds) are split at keyframes and encoded in parallel
+PARALLEL_MIN_DURATION = float(os.environ.get('PARALLEL_MIN_DURATION', 120))
+
+# Most ffmpeg processes encoding segments at the same time, shared by all jobs; each also
+# takes a core from the budget the workers' encodes use, so together they never exceed CPU_COUNT
+PARALLEL_SEGMENT_WORKERS = int(os.environ.get('PARALLEL_SEGMENT_WORKERS', CPU_COUNT))
+
+# Segments are no shorter than this, and about three per segment worker
+MIN_SEGMENT_SECONDS = 10
+
+# Objects uploaded at the same time when a job produces several files
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', 8))
+
+# Days a processed video is reused for identical uploads; keep in step with lifecycle.json
+DEDUP_TTL_DAYS = int(os.environ.get('DEDUP_TTL_DAYS', 30))
+
+# Storage clients are created on first use
+store = create_store(
+    STORAGE_BACKEND, bucket_name=BUCKET_NAME, local_dir=LOCAL_STORAGE_DIR,
+    secret=URL_SIGNING_KEY.encode('utf-8') if URL_SIGNING_KEY else None,
+    chunk_size=TRANSFER_CHUNK_SIZE, max_workers=TRANSFER_WORKERS,
+    parallel_threshold=PARALLEL_TRANSFER_THRESHOLD, stream_chunk_size=STREAM_CHUNK_SIZE
+)
+dedup_cache = DedupCache(store, 'processed/cache/', DEDUP_TTL_DAYS)
+# Ingested uploads are hashed like the backend would, so they share dedup keys with direct uploads
+ingest_sessions = IngestSessions(
+    INGEST_IDLE_TIMEOUT, JOB_RETENTION, max_sessions=INGEST_MAX_SESSIONS, checksums=store.keeps_checksums,
+    max_bytes=MAX_INGEST_BYTES
+)
+signed_urls = SignedUrlCache(store, timedelta(minutes=DOWNLOAD_URL_MINUTES), DOWNLOAD_URL_MARGIN)
+
+core_budget = CoreBudget(CPU_COUNT)
+segment_pool = ThreadPoolExecutor(max_workers=PARALLEL_SEGMENT_WORKERS, thread_name_prefix='segment')
+upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix='upload')
+encoder_policy = EncoderPolicy(ENCODER_PRESETS, TARGET_COMPLETION_SECONDS, CPU_COUNT, ENCODE_THREADS)
+
+# Encoding settings shared by every transcode
+ENCODE_OPTIONS = {
+    'vf': 'scale=640:360',  # Fixed 640x360 resolution
+    'r': 30,                # 30 frames per second
+    'preset': 'medium',     # Replaced per encode by the scheduler, from the backlog
+    'crf': 28,              # Higher CRF value = more compression (range: 18-28)
+    'maxrate': '800k',      # Maximum bitrate
+    'bufsize': '1200k',     # Buffer size
+    'pix_fmt': 'yuv420p',   # 4:2:0 chroma, which every browser can play
+    'threads': ENCODE_THREADS,
+}
+
+# Sizes and bitrate caps of the renditions an output profile can ask for
+RENDITIONS = {
+    '360p': {'width': 640, 'height': 360, 'maxrate': '800k', 'bufsize': '1200k'},
+    '540p': {'width': 960, 'height': 540, 'maxrate': '1500k', 'bufsize': '2250k'},
+    '720p': {'width': 1280, 'height': 720, 'maxrate': '2500k', 'bufsize': '3750k'},
+}
+
+# Output profiles accepted by /process: renditions, and whether they form an HLS ladder
+PROFILES = {
+    'mobile': (['360p'], False),
+    'ladder': (['360p', '540p', '720p'], False),
+    'hls': (['360p', '540p', '720p'], True),
+}
+DEFAULT_PROFILE = 'mobile'
+
+# Encoder settings shared by every rendition; sizes and rates come from RENDITIONS
+RENDITION_OPTIONS = {
+    name: value for name, value in ENCODE_OPTIONS.items() if name not in ('vf', 'r', 'maxrate', 'bufsize')
+}
+
+# Target duration of HLS segments, in seconds
+HLS_SEGMENT_SECONDS = 6
+
+# URI attributes of playlist tags, such as the init segment of EXT-X-MAP
+HLS_URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+
+# Content types of the files a rendition encode writes
+OUTPUT_CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4s': 'video/iso.segment',
+    '.m3u8': 'application/vnd.apple.mpegurl',
+}
 
-# Initialize GCS client
-storage_client = storage.Client()
-bucket = storage_client.bucket(BUCKET_NAME)
+# Inputs within these limits are copied instead of re-encoded
+TARGET_WIDTH = 640
+TARGET_HEIGHT = 360
+TARGET_FPS = 30
+TARGET_BITRATE = 800 * 1000
 
-def process_video(input_blob_name, output_blob_name):
-    """Process the video to 640x360 at 30fps with high compression"""
+# Output options for each processing path chosen by analyze_video
+PATH_OPTIONS = {
+    'remux': {'c': 'copy', 'sn': None, 'dn': None},
+    'audio': {'c:v': 'copy', 'c:a': 'aac', 'b:a': '128k', 'sn': None, 'dn': None},
+    'transcode': ENCODE_OPTIONS,
+}
+
+# Settings that change how fast an output is made but not what it should look like;
+# they are left out of the dedup key so outputs are reused whichever preset made them
+SCHEDULED_OPTIONS = ('preset', 'threads')
+
+# Everything that changes the output of a job, hashed into the dedup key
+DEDUP_PARAMS = {
+    'options': {name: value for name, value in ENCODE_OPTIONS.items() if name not in SCHEDULED_OPTIONS},
+    'target': [TARGET_WIDTH, TARGET_HEIGHT, TARGET_FPS, TARGET_BITRATE],
+}
+
+def analyze_video(path=None, head=None, size=None):
+    """Probe an input and pick the cheapest path to the output format: remux, audio or transcode.
+    
+    Returns the path and the probe report, which is empty if the probe failed.
+    """
     try:
-        # Download the input blob to a temporary file
-        input_blob = bucket.blob(input_blob_name)
-        
-        # Create temporary files for processing
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_input:
-            input_path = temp_input.name
-        
-        # Download the file from GCS
-        input_blob.download_to_filename(input_path)
-        
-        # Create a temporary file for the output
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_output:
-            output_path = temp_output.name
-        
-        # Get the ffmpeg command string for debugging
-        ffmpeg_cmd = (
-            ffmpeg
-            .input(input_path)
-            .output(output_path, 
-                   vf='scale=640:360',  # Fixed 640x360 resolution
-                   r=30,                # 30 frames per second
-                   preset='medium',     # Medium preset for balance of speed and compression
-                   crf=28,              # Higher CRF value = more compression (range: 18-28)
-                   maxrate='800k',      # Maximum bitrate
-                   bufsize='1200k',     # Buffer size
-                   movflags='+faststart') # Optimize for web streaming
-            .overwrite_output()         # Add overwrite_output() to avoid prompt
-            .compile()
+        with metrics.timed('probe'):
+            info = transcode.probe(path=path, head=head)
+    except Exception as e:
+        print(f"Probe failed, transcoding: {str(e)}")
+        return 'transcode', {}
+    
+    path = transcode.choose_path(info, TARGET_WIDTH, TARGET_HEIGHT, TARGET_FPS, TARGET_BITRATE, size=size)
+    return path, info
+
+def is_long(path, info):
+    """Tell whether an input should be encoded in parallel segments"""
+    duration = transcode.duration(info)
+    return path == 'transcode' and PARALLEL_SEGMENT_WORKERS > 1 and duration is not None and duration >= PARALLEL_MIN_DURATION
+
+def schedule_encoder(options, info, scale=1, cores=None):
+    """Set the preset and threads of an encode from the backlog, returning the options and the decision.
+    
+    `scale` is the encode's work per second of video relative to one
+    640x360 output. Options without a preset (stream copies) are returned
+    as they are, with no decision.
+    """
+    if 'preset' not in options:
+        return options, None
+    
+    duration = transcode.duration(info)
+    decision = encoder_policy.choose(jobs.stats(), duration * scale if duration else None, cores)
+    print(f"Encoder policy: preset {decision['preset']} with {decision['threads']} threads for "
+          f"{decision['work'] or 0:.0f}s of work, {decision['queued']} queued, estimate {decision['estimate']}s")
+    metrics.PRESETS.inc(preset=decision['preset'])
+    metrics.publish(encoder={name: decision[name] for name in ('preset', 'threads', 'estimate')})
+    return dict(options, preset=decision['preset'], threads=decision['threads']), decision
+
+@contextmanager
+def encoding(path, info, decision=None, cores=None):
+    """Time an encode and its speed relative to real time, yielding its progress callback.
+    
+    The encode holds `cores` of the core budget while it runs: by default
+    the threads `decision` gave ffmpeg, or its worker's share without one.
+    The time is also fed back to the scheduler that made `decision`.
+    """
+    if cores is None:
+        cores = decision['threads'] if decision is not None else ENCODE_THREADS
+    duration = transcode.duration(info)
+    with core_budget.take(cores):
+        start = time.perf_counter()
+        yield metrics.progress_callback(duration)
+        seconds = time.perf_counter() - start
+    metrics.observe_stage('encode', seconds)
+    if duration and seconds:
+        metrics.ENCODE_SPEED.observe(duration / seconds, path=path)
+    if decision is not None:
+        encoder_policy.observe(decision, seconds)
+
+def record_transfer(stage, direction, stream):
+    """Record the bytes moved by a streamed download or upload and the time spent waiting on storage"""
+    metrics.observe_stage(stage, stream.seconds)
+    metrics.count_bytes(direction, stream.bytes)
+
+def encode_stream(reader, size, open_writer):
+    """Encode an input read from a stream into what `open_writer()` opens, returning None if it needs a seekable file.
+    
+    The writer is only opened once the input has been probed, and is left
+    through an exception if ffmpeg fails.
+    """
+    head = reader.read(transcode.HEAD_SIZE)
+    if not transcode.is_streamable(head):
+        return None
+    
+    path, info = analyze_video(head=head, size=size)
+    
+    # Long inputs are split into segments, which needs a seekable file
+    if is_long(path, info):
+        return None
+    
+    # Output is fragmented MP4, since +faststart needs a seekable file
+    options, decision = schedule_encoder(PATH_OPTIONS[path], info)
+    ffmpeg_cmd = transcode.pipe_command(options)
+    print(f"Running FFmpeg command: {' '.join(ffmpeg_cmd)}")
+    with open_writer() as writer, encoding(path, info, decision) as progress:
+        transcode.run_pipe(ffmpeg_cmd, head, reader, writer, progress)
+    return path
+
+def transcode_streaming(input_info, output_name):
+    """Pipe the download through ffmpeg into the upload, returning None if the input needs seeking"""
+    @contextmanager
+    def open_upload():
+        # The upload only completes if ffmpeg succeeds; an exception cancels it
+        writer = metrics.MeteredStream(
+            store.open_write(output_name, 'video/mp4', custom_time=datetime.now(timezone.utc))
         )
+        try:
+            with writer:
+                yield writer
+        finally:
+            record_transfer('upload', 'out', writer)
+    
+    reader = metrics.MeteredStream(store.open_read(input_info.name))
+    try:
+        with reader:
+            return encode_stream(reader, input_info.size, open_upload)
+    finally:
+        record_transfer('download', 'in', reader)
+
+def download_hashed(input_info, input_path):
+    """Download an object to a file, hashing its content on the way"""
+    with metrics.timed('download'), store.open_read(input_info.name) as reader, open(input_path, 'wb') as f:
+        hashing = HashingReader(reader)
+        shutil.copyfileobj(hashing, f, STREAM_CHUNK_SIZE)
+    metrics.count_bytes('in', input_info.size)
+    return hashing.digest()
+
+def download(input_info, input_path):
+    """Download an input to a file"""
+    with metrics.timed('download'):
+        store.download(input_info.name, input_path, size=input_info.size)
+    metrics.count_bytes('in', input_info.size)
+
+def transcode_file(input_info, output_name, temp_dir, input_path=None):
+    """Encode a downloaded input into a faststart MP4 next to it and upload it"""
+    output_path = os.path.join(temp_dir, 'output.mp4')
+    
+    # Download the file unless it already is
+    if input_path is None:
+        input_path = os.path.join(temp_dir, 'input')
+        download(input_info, input_path)
+    
+    path, info = analyze_video(path=input_path)
+    if is_long(path, info):
+        path = 'parallel'
+        segment_seconds = max(MIN_SEGMENT_SECONDS, transcode.duration(info) / (PARALLEL_SEGMENT_WORKERS * 3))
+        segment_dir = os.path.join(temp_dir, 'segments')
+        os.mkdir(segment_dir)
+        # Segments are encoded by single-threaded processes, each taking a core from the
+        # budget, so the job holds no cores of its own while they run
+        options, decision = schedule_encoder(ENCODE_OPTIONS, info, cores=PARALLEL_SEGMENT_WORKERS)
+        with encoding(path, info, decision, cores=0) as progress:
+            segments = transcode.run_segmented(
+                input_path, output_path, options, segment_dir, segment_seconds,
+                segment_pool, audio=transcode.has_audio(info), progress=progress, core_budget=core_budget
+            )
+        print(f"Encoded {input_path} as {segments} parallel segments")
+    else:
+        options, decision = schedule_encoder(PATH_OPTIONS[path], info)
+        ffmpeg_cmd = transcode.file_command(input_path, output_path, options)
         print(f"Running FFmpeg command: {' '.join(ffmpeg_cmd)}")
+        with encoding(path, info, decision) as progress:
+            transcode.run_file(ffmpeg_cmd, progress)
+    
+    # Upload the processed file
+    with metrics.timed('upload'):
+        store.upload(output_name, output_path, 'video/mp4', custom_time=datetime.now(timezone.utc))
+    metrics.count_bytes('out', os.path.getsize(output_path))
+    return path
+
+def encode_single(input_info, key, temp_dir, input_path):
+    """Produce the single 640x360 MP4 of the default profile, unless it is cached"""
+    cached = dedup_cache.lookup(key)
+    if cached is not None:
+        return {'path': 'cached', 'output': cached.name}
+    
+    output_name = dedup_cache.name(key)
+    
+    # Inputs with their index at the end cannot be read from a pipe
+    path = None
+    if TRANSCODE_MODE == 'streaming' and input_path is None:
+        path = transcode_streaming(input_info, output_name)
+    if path is None:
+        path = transcode_file(input_info, output_name, temp_dir, input_path)
+    return {'path': path, 'output': output_name}
+
+def upload_directory(local_dir, key):
+    """Upload every file under a directory into a cache entry concurrently, returning the object names"""
+    custom_time = datetime.now(timezone.utc)
+    uploads = []
+    for root, _, files in os.walk(local_dir):
+        for name in files:
+            local_path = os.path.join(root, name)
+            object_name = dedup_cache.name(key, '/' + os.path.relpath(local_path, local_dir).replace(os.sep, '/'))
+            content_type = OUTPUT_CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+            future = upload_pool.submit(store.upload, object_name, local_path, content_type, custom_time=custom_time)
+            uploads.append((object_name, future))
+            metrics.count_bytes('out', os.path.getsize(local_path))
+    for _, future in uploads:
+        future.result()
+    return [object_name for object_name, _ in uploads]
+
+def encode_renditions(input_info, profile, key, temp_dir, input_path):
+    """Decode the input once and encode every rendition of a profile, unless they are cached"""
+    cached = dedup_cache.lookup(key, '/manifest.json', refresh=False)
+    if cached is not None:
+        return dict(json.loads(store.read_text(cached.name)), path='cached')
+    
+    if input_path is None:
+        input_path = os.path.join(temp_dir, 'input')
+        download(input_info, input_path)
+    
+    _, info = analyze_video(path=input_path)
+    names, hls = PROFILES[profile]
+    output_dir = os.path.join(temp_dir, 'renditions')
+    for name in names if hls else ['']:
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+    
+    # Work grows with the pixels encoded, relative to one 640x360 output
+    scale = sum(RENDITIONS[name]['width'] * RENDITIONS[name]['height'] for name in names) / (TARGET_WIDTH * TARGET_HEIGHT)
+    options, decision = schedule_encoder(RENDITION_OPTIONS, info, scale=scale)
+    ffmpeg_cmd = transcode.rendition_command(
+        input_path, output_dir, [(name, RENDITIONS[name]) for name in names], options, TARGET_FPS,
+        audio=transcode.has_audio(info), hls_segment_seconds=HLS_SEGMENT_SECONDS if hls else None
+    )
+    print(f"Running FFmpeg command: {' '.join(ffmpeg_cmd)}")
+    with encoding(profile, info, decision) as progress:
+        transcode.run_file(ffmpeg_cmd, progress)
+    
+    prefix = f"{dedup_cache.prefix}{key}/"
+    with metrics.timed('upload'):
+        uploaded = upload_directory(output_dir, key)
+        print(f"Uploaded {len(uploaded)} files for {profile} under {prefix}")
         
-        # Run the command using subprocess to better handle errors
-        process = subprocess.Popen(
-            ffmpeg_cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE
+        # The manifest is written last, so a cached entry is always complete
+        renditions = {
+            name: prefix + (f"{name}/index.m3u8" if hls else f"{name}.mp4") for name in names
+        }
+        manifest = {
+            'output': prefix + 'master.m3u8' if hls else renditions[names[0]],
+            'renditions': renditions,
+            'hls': hls,
+        }
+        store.upload_bytes(
+            dedup_cache.name(key, '/manifest.json'), json.dumps(manifest), 'application/json',
+            custom_time=datetime.now(timezone.utc)
         )
-        stdout, stderr = process.communicate()
-        
-        if process.returncode != 0:
-            print(f"FFmpeg stderr: {stderr.decode()}")
-            # Clean up temporary files
-            os.unlink(input_path)
-            if os.path.exists(output_path):
-                os.unlink(output_path)
-            return False
-        
-        # Upload the processed file to GCS
-        output_blob = bucket.blob(output_blob_name)
-        output_blob.upload_from_filename(output_path)
+    return dict(manifest, path=profile)
+
+def encode_input(input_info, digest, profile, temp_dir, input_path):
+    """Produce the outputs of a profile for an input with a known digest, reusing cached ones"""
+    if profile == DEFAULT_PROFILE:
+        key = dedup_cache.key(digest, DEDUP_PARAMS)
+        with dedup_cache.claim(key):
+            return encode_single(input_info, key, temp_dir, input_path)
+    
+    names, hls = PROFILES[profile]
+    params = {
+        'options': {name: value for name, value in RENDITION_OPTIONS.items() if name not in SCHEDULED_OPTIONS},
+        'renditions': [RENDITIONS[name] for name in names],
+        'fps': TARGET_FPS,
+        'hls': HLS_SEGMENT_SECONDS if hls else None,
+    }
+    key = dedup_cache.key(digest, params)
+    with dedup_cache.claim(key):
+        return encode_renditions(input_info, profile, key, temp_dir, input_path)
+
+def process_video(input_blob_name, profile=DEFAULT_PROFILE):
+    """Process the video to 640x360 at 30fps with high compression, or to the renditions of a profile.
+    
+    Outputs are stored under a key made of the input's content and the
+    encoding settings, so a repeated upload reuses the earlier output.
+    Returns a dict with the processing path taken and the output object name
+    (plus each rendition's object for multi-rendition profiles), or None on
+    failure.
+    """
+    try:
+        input_info = store.stat(input_blob_name)
+        if input_info is None:
+            raise FileNotFoundError(input_blob_name)
         
-        # Clean up temporary files
-        os.unlink(input_path)
-        os.unlink(output_path)
+        with tempfile.TemporaryDirectory(prefix='video-') as temp_dir:
+            # Without a stored checksum, the input is hashed while it downloads
+            input_path = None
+            digest = stored_digest(input_info)
+            if digest is None:
+                input_path = os.path.join(temp_dir, 'input')
+                digest = download_hashed(input_info, input_path)
+            
+            result = encode_input(input_info, digest, profile, temp_dir, input_path)
+        print(f"Processed {input_blob_name} via {result['path']} into {result['output']}")
         
         # Delete the input blob to save storage
-        input_blob.delete()
+        store.delete(input_blob_name)
         
-        return True
+        return result
+    except transcode.TranscodeError as e:
+        print(f"FFmpeg stderr: {str(e)}")
+        return None
     except Exception as e:
         print(f"Processing error: {str(e)}")
+        return None
+
+def transcode_ingest(session, output_path):
+    """Encode an upload while it arrives into a fragmented MP4 file, returning None if it needs the whole file"""
+    with session.reader() as reader:
+        return encode_stream(reader, session.total, lambda: open(output_path, 'wb'))
+
+def process_ingest(session, profile=DEFAULT_PROFILE):
+    """Process a video while its upload is still arriving, returning the same as process_video.
+    
+    The default profile is encoded from the partial upload as soon as its
+    header has arrived, so little is left to do when the last chunk lands.
+    Inputs that need seeking, long inputs and other profiles are processed
+    from the spooled file once the upload is complete. The dedup key is
+    only known then, so a repeated upload is still encoded but not stored
+    twice.
+    """
+    try:
+        with tempfile.TemporaryDirectory(prefix='video-') as temp_dir:
+            output_path = os.path.join(temp_dir, 'output.mp4')
+            path = transcode_ingest(session, output_path) if profile == DEFAULT_PROFILE else None
+            
+            with metrics.timed('receive'):
+                digest = session.wait()
+            metrics.count_bytes('in', session.received)
+            input_info = ObjectInfo(session.name, session.received, None, None, None, None)
+            
+            if path is None:
+                result = encode_input(input_info, digest, profile, temp_dir, session.path)
+            else:
+                key = dedup_cache.key(digest, DEDUP_PARAMS)
+                with dedup_cache.claim(key):
+                    cached = dedup_cache.lookup(key)
+                    if cached is not None:
+                        result = {'path': 'cached', 'output': cached.name}
+                    else:
+                        result = {'path': path, 'output': dedup_cache.name(key)}
+                        with metrics.timed('upload'):
+                            store.upload(result['output'], output_path, 'video/mp4', custom_time=datetime.now(timezone.utc))
+                        metrics.count_bytes('out', os.path.getsize(output_path))
+        print(f"Processed {session.name} while it uploaded, via {result['path']} into {result['output']}")
+        return result
+    except transcode.TranscodeError as e:
+        print(f"FFmpeg stderr: {str(e)}")
+        return None
+    except Exception as e:
+        print(f"Processing error: {str(e)}")
+        return None
+    finally:
+        ingest_sessions.close(session.name)
+
+def generate_signed_url(blob_name):
+    """Generate a signed URL for a blob with a short expiration time"""
+    # URLs are signed without a request to storage and reused until shortly before they expire
+    url, _ = signed_urls.get(blob_name)
+    return url
+
+def is_processed_video(name):
+    """Whether `name` is an existing object of the dedup cache, the only ones the app signs"""
+    # Names that normalise differently could climb out of the cache with '..'
+    if not name.startswith(dedup_cache.prefix) or posixpath.normpath(name) != name:
         return False
+    return store.exists(name)
 
-def generate_public_url(blob_name, expiration_minutes=30):
-    """Generate a public URL for a blob with a short expiration time"""
-    blob = bucket.blob(blob_name)
+def hls_url(name):
+    """Return the app URL that serves an HLS playlist with signed links"""
+    return '/hls/' + urllib.parse.quote(name)
+
+def sign_playlist(name, text):
+    """Rewrite the relative URIs of a stored playlist: playlists to hls_url, segments to signed URLs"""
+    base = posixpath.dirname(name)
+    
+    def link(uri):
+        target = posixpath.normpath(posixpath.join(base, uri))
+        if not target.startswith(dedup_cache.prefix):
+            raise ValueError(f'Playlist entry outside the cache: {uri}')
+        if target.endswith('.m3u8'):
+            return hls_url(target)
+        url, _ = signed_urls.get(target)
+        return url
+    
+    lines = []
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            line = link(line)
+        elif line.startswith('#'):
+            line = HLS_URI_ATTRIBUTE.sub(lambda match: f'URI="{link(match.group(1))}"', line)
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+def run_job(job):
+    """Transcode the video for a queued job and return its download URL"""
+    input_blob_name = f"uploads/{job['fileId']}{job['fileExt']}"
     
-    # Make the blob publicly accessible for a short time
-    blob.make_public()
+    # Stage timings, byte counts and encode progress are copied into the job as they change
+    stats = metrics.start_job_stats(lambda **fields: jobs.update(job['jobId'], **fields))
+    start = time.perf_counter()
+    session = ingest_sessions.get(input_blob_name)
+    if session is not None:
+        result = process_ingest(session, job['profile'])
+    else:
+        result = process_video(input_blob_name, job['profile'])
+    elapsed = time.perf_counter() - start
     
-    # Get the public URL
-    public_url = blob.public_url
+    path = result['path'] if result is not None else 'failed'
+    metrics.JOBS.inc(status='done' if result is not None else 'failed', path=path)
+    metrics.JOB_SECONDS.observe(elapsed, path=path)
+    stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in stats.timings.items())
+    print(f"Job {job['jobId']} took {elapsed:.2f}s ({stages}); {stats.bytes_in} bytes in, {stats.bytes_out} bytes out")
+    if result is None:
+        raise RuntimeError('Failed to process video')
     
-    # Schedule the blob to be made private again after expiration
-    # In a production environment, you would use Cloud Functions or Cloud Scheduler for this
-    # For now, we'll rely on the download page to inform users of the expiration
+    # HLS objects stay private; their playlists are served with a signed URL per segment
+    if result.get('hls'):
+        return {
+            'downloadUrl': hls_url(result['output']),
+            'renditions': {name: hls_url(blob_name) for name, blob_name in result['renditions'].items()},
+            'path': result['path'],
+        }
     
-    return public_url
+    # The object name lets the download page get a fresh URL once this one expires
+    response = {'downloadUrl': generate_signed_url(result['output']), 'output': result['output'], 'path': result['path']}
+    if 'renditions' in result:
+        response['renditions'] = {name: generate_signed_url(blob_name) for name, blob_name in result['renditions'].items()}
+    return response
+
+jobs = JobQueue(run_job, TRANSCODE_WORKERS, MAX_QUEUED_JOBS, JOB_RETENTION)
 
 @app.route('/')
 def index():
@@ -122,11 +630,22 @@ def get_upload_url():
         # Define GCS paths
         input_blob_name = f"uploads/{unique_id}{file_ext}"
         
-        # Create a new blob and get a resumable upload URL
-        blob = bucket.blob(input_blob_name)
+        # In ingest mode the upload comes to this server in chunks, under the name issued here
+        if UPLOAD_MODE == 'ingest':
+            try:
+                ingest_sessions.issue(input_blob_name)
+            except IngestFull:
+                return jsonify({'error': 'Too many uploads in progress, please try again shortly'}), 503, {'Retry-After': '30'}
+            return jsonify({
+                'uploadUrl': url_for('ingest_upload', name=input_blob_name),
+                'fileId': unique_id,
+                'fileExt': file_ext,
+                'ingest': True,
+                'chunkSize': INGEST_CHUNK_SIZE
+            })
         
         # Create a resumable upload session
-        upload_url = f"https://storage.googleapis.com/upload/storage/v1/b/{BUCKET_NAME}/o?uploadType=resumable&name={urllib.parse.quote(input_blob_name)}"
+        upload_url = store.upload_url(input_blob_name)
         
         return jsonify({
             'uploadUrl': upload_url,
@@ -147,38 +666,186 @@ def process():
             
         file_id = data['fileId']
         file_ext = data['fileExt']
+        profile = data.get('profile', DEFAULT_PROFILE)
+        if profile not in PROFILES:
+            return jsonify({'error': f"Unknown profile, expected one of: {', '.join(PROFILES)}"}), 400
         
         # Define GCS paths
         input_blob_name = f"uploads/{file_id}{file_ext}"
-        output_blob_name = f"processed/{file_id}{file_ext}"
         
-        # Check if the input blob exists
-        input_blob = bucket.blob(input_blob_name)
-        if not input_blob.exists():
+        # Check if the input blob exists, or is being uploaded to this server
+        session = ingest_sessions.get(input_blob_name)
+        if session is None and not store.exists(input_blob_name):
             return jsonify({'error': 'Uploaded file not found'}), 404
         
-        # Process the video asynchronously
-        success = process_video(input_blob_name, output_blob_name)
+        # An upload still arriving only takes a worker once there is enough of it to start on:
+        # its header for the default profile, all of it for the others
+        when_ready = None
+        if session is not None:
+            size = transcode.HEAD_SIZE if profile == DEFAULT_PROFILE else float('inf')
+            when_ready = lambda callback: session.on_available(size, callback)
         
-        if success:
-            # Generate a public URL for download
-            download_url = generate_public_url(output_blob_name)
-            
-            return jsonify({
-                'success': True,
-                'downloadUrl': download_url,
-                'fileId': file_id,
-                'fileExt': file_ext
-            })
-        else:
-            return jsonify({'error': 'Failed to process video'}), 500
+        # Queue the video; a worker picks it up when one is free
+        try:
+            job = jobs.submit(when_ready, fileId=file_id, fileExt=file_ext, profile=profile, downloadUrl=None)
+        except QueueFull:
+            return jsonify({'error': 'Too many videos are being processed, please try again shortly'}), 503, {'Retry-After': '30'}
+        
+        return jsonify({
+            'success': True,
+            'jobId': job['jobId'],
+            'statusUrl': url_for('job_status', job_id=job['jobId']),
+            'fileId': file_id,
+            'fileExt': file_ext,
+            'profile': profile
+        }), 202
             
     except Exception as e:
         print(f"Error processing video: {str(e)}")
         return jsonify({'error': 'Failed to process video'}), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status of a queued video: waiting (for its upload), queued, running, done or failed"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/progress')
+def job_progress(job_id):
+    """Report how far a job's encode has got, with the time and bytes of each stage so far"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    fields = ('jobId', 'status', 'queuePosition', 'progress', 'timings', 'bytesIn', 'bytesOut')
+    return jsonify({name: job.get(name) for name in fields})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Expose job, stage and transfer metrics in the Prometheus text format"""
+    queue = jobs.stats()
+    extra_lines = []
+    for name, value in (('workers', queue['workers']), ('jobs_running', queue['running']),
+                        ('jobs_queued', queue['queued']), ('jobs_waiting', queue['waiting']),
+                        ('queue_capacity', queue['capacity'])):
+        extra_lines += [f'# TYPE video_{name} gauge', f'video_{name} {value}']
+    cache = dedup_cache.stats()
+    for name in ('hits', 'misses', 'expired'):
+        extra_lines += [f'# TYPE video_dedup_{name}_total counter', f'video_dedup_{name}_total {cache[name]}']
+    return Response(metrics.render(extra_lines), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache')
+def cache_stats():
+    """Report how often uploads were served from the dedup cache"""
+    return jsonify(dedup_cache.stats())
+
+@app.route('/storage/<path:name>', methods=['GET', 'POST', 'PUT'])
+def local_object(name):
+    """Serve and accept uploads of objects when videos are stored in a local directory"""
+    if not isinstance(store, LocalStore):
+        return jsonify({'error': 'Not found'}), 404
+    
+    # Browsers may only upload new inputs; names that normalise differently could climb out with '..'
+    if request.method != 'GET' and (not name.startswith('uploads/') or posixpath.normpath(name) != name):
+        return jsonify({'error': 'Uploads must go to uploads/'}), 403
+    
+    # Starting a resumable upload: the session URI is the object's own URL
+    if request.method == 'POST':
+        return '', 200, {'Location': store.public_url(name)}
+    
+    if request.method == 'PUT':
+        # Read the raw stream, since uploads are larger than MAX_CONTENT_LENGTH
+        length = int(request.headers.get('Content-Length', 0))
+        body = LimitedStream(request.environ['wsgi.input'], length)
+        with store.open_write(name, request.content_type) as writer:
+            shutil.copyfileobj(body, writer, STREAM_CHUNK_SIZE)
+        return jsonify({'name': name}), 200
+    
+    # Nothing is public: every read needs a valid signed URL, HLS segments included
+    if not store.verify(name, request.args.get('expires'), request.args.get('signature')):
+        return jsonify({'error': 'Download link is invalid or has expired'}), 403
+    
+    try:
+        path = store.path(name)
+    except ValueError:
+        return jsonify({'error': 'Not found'}), 404
+    if not os.path.isfile(path):
+        return jsonify({'error': 'Not found'}), 404
+    return send_file(path, mimetype=OUTPUT_CONTENT_TYPES.get(os.path.splitext(name)[1]), conditional=True)
+
+@app.route('/ingest/<path:name>', methods=['POST', 'PUT'])
+def ingest_upload(name):
+    """Receive an upload in chunks, so that its video is processed while it arrives"""
+    if not name.startswith('uploads/') or '..' in name:
+        return jsonify({'error': 'Uploads must go to uploads/'}), 403
+    
+    # Starting a resumable upload: the session URI is this same URL
+    if request.method == 'POST':
+        try:
+            total = parse_length(request.headers.get('X-Upload-Content-Length'))
+            session = ingest_sessions.create(name, total)
+        except IngestTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if session is None:
+            return jsonify({'error': 'Upload was not issued by /get-upload-url or has already started'}), 403
+        return '', 200, {'Location': url_for('ingest_upload', name=name)}
+    
+    session = ingest_sessions.get(name)
+    if session is None:
+        return jsonify({'error': 'Upload session not found or expired'}), 404
+    try:
+        start, total = parse_content_range(request.headers.get('Content-Range'))
+        length = parse_length(request.headers.get('Content-Length')) or 0
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Read the raw stream, since chunks are larger than MAX_CONTENT_LENGTH
+    body = LimitedStream(request.environ['wsgi.input'], length)
+    try:
+        received = session.write(start, body, length, total)
+    except IngestTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 410
+    
+    if session.complete:
+        return jsonify({'name': name}), 200
+    
+    # Like storage's resumable uploads: 308 with the range received so far
+    headers = {'Range': f'bytes=0-{received - 1}'} if received else {}
+    return '', 308, headers
+
+@app.route('/hls/<path:name>')
+def hls_playlist(name):
+    """Serve an HLS playlist of a processed video with signed links to its segments"""
+    # Like /download-url, processed videos are found by their unguessable content hash
+    if not name.endswith('.m3u8') or not is_processed_video(name):
+        return jsonify({'error': 'Video not found or no longer available'}), 404
+    
+    try:
+        playlist = sign_playlist(name, store.read_text(name))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 500
+    # Players must not keep the playlist past the links it carries
+    return Response(playlist, mimetype=OUTPUT_CONTENT_TYPES['.m3u8'], headers={'Cache-Control': 'no-store'})
+
 @app.route('/download')
 def download_page():
+    # Processed videos are passed by name, so the page can renew their URL
+    name = request.args.get('name')
+    if name:
+        if not is_processed_video(name):
+            return jsonify({'error': 'Video not found or no longer available'}), 404
+        download_url, expires_at = signed_urls.get(name)
+        return render_template('download.html', signed_url=download_url, name=name, expires_at=expires_at.isoformat())
+    
     download_url = request.args.get('url')
     
     if not download_url:
@@ -186,6 +853,18 @@ def download_page():
     
     return render_template('download.html', signed_url=download_url)
 
+@app.route('/download-url')
+def refresh_download_url():
+    """Return a current signed URL for a processed video, for pages left open past the expiry"""
+    name = request.args.get('name', '')
+    
+    # Only processed videos are signed; their names are unguessable content hashes
+    if not is_processed_video(name):
+        return jsonify({'error': 'Video not found or no longer available'}), 404
+    
+    url, expires_at = signed_urls.get(name)
+    return jsonify({'url': url, 'expiresAt': expires_at.isoformat()})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8081))
     app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+End-to-end processing benchmark for the video API, without cloud credentials.
+
+Generates synthetic test clips with ffmpeg, stores them in a temporary local
+storage directory (STORAGE_BACKEND=local) and runs process_video on each one,
+reporting wall-clock time, the time spent in each stage (download, probe,
+encode, upload), the processing path taken and the speed relative to real
+time. Every clip has unique content, so the dedup cache never hits.
+
+Usage:
+    python benchmarks/pipeline.py --durations 10,60,300 --modes streaming,file --profiles mobile,ladder
+
+Requires ffmpeg and ffprobe on PATH.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stages reported by process_video, in the order they are printed
+STAGES = ['download', 'probe', 'encode', 'upload']
+
+
+def parse_list(value):
+    return [item for item in value.split(',') if item]
+
+
+def parse_floats(value):
+    return [float(item) for item in parse_list(value)]
+
+
+def make_clip(path, duration, size, fps, faststart):
+    """Encode a synthetic clip with a moving test pattern and a tone"""
+    subprocess.run(
+        [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}:duration={duration}',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-shortest',
+            # Unique metadata, so that no two clips share a dedup key
+            '-metadata', f'comment={uuid.uuid4()}',
+        ] + (['-movflags', '+faststart'] if faststart else []) + [path],
+        check=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark video processing end to end on local storage')
+    parser.add_argument('--durations', type=parse_floats, default=[10, 60],
+                        help='Comma-separated clip durations in seconds')
+    parser.add_argument('--size', default='1280x720', help='Source resolution')
+    parser.add_argument('--fps', type=int, default=30, help='Source frame rate')
+    parser.add_argument('--modes', type=parse_list, default=['streaming', 'file'],
+                        help='Comma-separated TRANSCODE_MODE values')
+    parser.add_argument('--profiles', type=parse_list, default=['mobile'],
+                        help='Comma-separated output profiles')
+    parser.add_argument('--runs', type=int, default=1, help='Runs per configuration')
+    parser.add_argument('--moov-at-end', action='store_true',
+                        help='Write clips without +faststart, which forces the temporary-file path')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    storage_dir = tempfile.mkdtemp(prefix='video-bench-')
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_DIR'] = storage_dir
+    sys.path.insert(0, API_DIR)
+    import app as api
+
+    results = []
+    print(f"{'duration':>8} {'mode':>9} {'profile':>7} {'path':>9} {'median_s':>9} {'speed':>7}"
+          + ''.join(f' {stage:>9}' for stage in STAGES))
+    for duration in args.durations:
+        for mode in args.modes:
+            for profile in args.profiles:
+                api.TRANSCODE_MODE = mode
+                timings = []
+                stages = []
+                paths = set()
+                for _ in range(args.runs):
+                    name = f'uploads/{uuid.uuid4()}.mp4'
+                    clip_path = os.path.join(storage_dir, 'clip.mp4')
+                    make_clip(clip_path, duration, args.size, args.fps, not args.moov_at_end)
+                    api.store.upload(name, clip_path, 'video/mp4')
+                    stats = api.metrics.start_job_stats(lambda **fields: None)
+                    start = time.perf_counter()
+                    result = api.process_video(name, profile)
+                    timings.append(time.perf_counter() - start)
+                    stages.append(stats.timings)
+                    if result is None:
+                        sys.exit(f'Processing failed for {duration}s {mode} {profile}')
+                    paths.add(result['path'])
+                median = statistics.median(timings)
+                row = {
+                    'duration': duration, 'mode': mode, 'profile': profile,
+                    'paths': sorted(paths), 'median_s': median, 'timings': timings,
+                    'speed': duration / median,
+                    'stages': {
+                        stage: statistics.median(run.get(stage, 0.0) for run in stages) for stage in STAGES
+                    },
+                }
+                results.append(row)
+                print(f"{duration:>8g} {mode:>9} {profile:>7} {','.join(row['paths']):>9} "
+                      f"{median:>9.2f} {row['speed']:>6.1f}x"
+                      + ''.join(f" {row['stages'][stage]:>9.2f}" for stage in STAGES))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
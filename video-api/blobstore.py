@@ -0,0 +1,321 @@
+import hashlib
+import hmac
+import os
+import shutil
+import threading
+import urllib.parse
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+# Metadata of a stored object; md5_hash and crc32c are None when the backend keeps no checksums
+ObjectInfo = namedtuple('ObjectInfo', ['name', 'size', 'md5_hash', 'crc32c', 'custom_time', 'time_created'])
+
+
+class GCSStore:
+    """Objects in a Cloud Storage bucket.
+
+    The client is created on first use, so importing the app needs neither
+    credentials nor network access. Objects of at least
+    `parallel_threshold` bytes are downloaded as concurrent byte-range
+    slices and uploaded as multipart uploads of `chunk_size` parts, using
+    `max_workers` connections each.
+    """
+
+    # Objects carry MD5 and CRC32C checksums, see dedup.stored_digest
+    keeps_checksums = True
+
+    def __init__(self, bucket_name, chunk_size=32 * 1024 * 1024, max_workers=8,
+                 parallel_threshold=64 * 1024 * 1024, stream_chunk_size=8 * 1024 * 1024):
+        self.bucket_name = bucket_name
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.parallel_threshold = parallel_threshold
+        self.stream_chunk_size = stream_chunk_size
+        self._bucket = None
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    import google.auth
+                    from google.cloud import storage
+                    # The credentials are kept to sign URLs with
+                    credentials, project = google.auth.default(scopes=['https://www.googleapis.com/auth/cloud-platform'])
+                    self._credentials = credentials
+                    self._bucket = storage.Client(project=project, credentials=credentials).bucket(self.bucket_name)
+        return self._bucket
+
+    def stat(self, name):
+        """Return an object's metadata, or None if it does not exist"""
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            return None
+        return ObjectInfo(blob.name, blob.size, blob.md5_hash, blob.crc32c, blob.custom_time, blob.time_created)
+
+    def exists(self, name):
+        return self.bucket.blob(name).exists()
+
+    def open_read(self, name):
+        """Open an object for reading in chunks"""
+        return self.bucket.blob(name).open('rb', chunk_size=self.stream_chunk_size)
+
+    def open_write(self, name, content_type, custom_time=None):
+        """Open an object for writing in chunks.
+
+        The object only appears once the writer is closed; leaving a `with`
+        block through an exception cancels the upload instead.
+        """
+        blob = self.bucket.blob(name)
+        blob.custom_time = custom_time
+        return blob.open('wb', chunk_size=self.stream_chunk_size, content_type=content_type)
+
+    def download(self, name, path, size=None):
+        """Download an object to a file, in parallel slices when it is large"""
+        from google.cloud.storage import transfer_manager
+
+        blob = self.bucket.blob(name)
+        if size is None:
+            blob.reload()
+            size = blob.size
+        if size < self.parallel_threshold:
+            blob.download_to_filename(path)
+            return
+        transfer_manager.download_chunks_concurrently(
+            blob, path, chunk_size=self.chunk_size, max_workers=self.max_workers,
+            worker_type=transfer_manager.THREAD
+        )
+
+    def upload(self, name, path, content_type, custom_time=None):
+        """Upload a file, as a parallel multipart upload when it is large"""
+        from google.cloud.storage import transfer_manager
+
+        blob = self.bucket.blob(name)
+        blob.custom_time = custom_time
+        if os.path.getsize(path) < self.parallel_threshold:
+            blob.upload_from_filename(path, content_type=content_type)
+            return
+        transfer_manager.upload_chunks_concurrently(
+            path, blob, content_type=content_type, chunk_size=self.chunk_size,
+            max_workers=self.max_workers, worker_type=transfer_manager.THREAD
+        )
+
+    def upload_bytes(self, name, data, content_type, custom_time=None):
+        blob = self.bucket.blob(name)
+        blob.custom_time = custom_time
+        blob.upload_from_string(data, content_type=content_type)
+
+    def read_text(self, name):
+        return self.bucket.blob(name).download_as_text()
+
+    def delete(self, name):
+        self.bucket.blob(name).delete()
+
+    def touch(self, name, custom_time):
+        """Move an object's custom time forward"""
+        blob = self.bucket.blob(name)
+        blob.custom_time = custom_time
+        blob.patch()
+
+    def public_url(self, name):
+        return self.bucket.blob(name).public_url
+
+    def signed_url(self, name, expires_at):
+        """Return a V4 signed URL that lets anyone read an object until `expires_at`.
+
+        With service account key credentials the URL is signed locally.
+        Credentials without a private key, like Cloud Run's default ones,
+        have the IAM API sign it instead, which is one request per URL. Their
+        access token is refreshed by one request thread at a time.
+        """
+        from google.auth.credentials import Signing
+
+        blob = self.bucket.blob(name)
+        credentials = self._credentials
+        options = {}
+        if not isinstance(credentials, Signing):
+            with self._refresh_lock:
+                if not credentials.valid:
+                    from google.auth.transport.requests import Request
+                    credentials.refresh(Request())
+                options = {'service_account_email': credentials.service_account_email, 'access_token': credentials.token}
+        return blob.generate_signed_url(version='v4', expiration=expires_at, method='GET', **options)
+
+    def upload_url(self, name):
+        """Return the URL a browser starts a resumable upload of `name` at"""
+        return (
+            f"https://storage.googleapis.com/upload/storage/v1/b/{self.bucket_name}/o"
+            f"?uploadType=resumable&name={urllib.parse.quote(name)}"
+        )
+
+
+class _LocalWriter:
+    """Writes a local object to a side file that replaces it on close"""
+
+    def __init__(self, path, custom_time=None):
+        self._path = path
+        self._custom_time = custom_time
+        self._file = open(path + '.part', 'wb')
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        os.replace(self._path + '.part', self._path)
+        if self._custom_time is not None:
+            timestamp = self._custom_time.timestamp()
+            os.utime(self._path, (timestamp, timestamp))
+
+    def terminate(self):
+        self._file.close()
+        os.unlink(self._path + '.part')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.terminate()
+        else:
+            self.close()
+
+
+class LocalStore:
+    """Objects as files under a local directory, standing in for the bucket.
+
+    Lets the whole pipeline run and be benchmarked without cloud
+    credentials. Custom times are kept as file modification times and no
+    checksums are stored, so the dedup cache hashes inputs as they download.
+    URLs point at `base_url`, which the app serves from the directory.
+    Signed URLs carry an HMAC of the name and expiry made with `secret`,
+    which defaults to a random key, so they do not survive a restart.
+    """
+
+    keeps_checksums = False
+
+    def __init__(self, root, base_url='/storage', secret=None):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url
+        self.secret = secret or os.urandom(32)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, name):
+        """Return the file backing an object, refusing names outside the root"""
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'Invalid object name: {name}')
+        return path
+
+    def _create(self, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def stat(self, name):
+        try:
+            stat = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        return ObjectInfo(name, stat.st_size, None, None, modified, modified)
+
+    def exists(self, name):
+        return os.path.isfile(self.path(name))
+
+    def open_read(self, name):
+        return open(self.path(name), 'rb')
+
+    def open_write(self, name, content_type, custom_time=None):
+        return _LocalWriter(self._create(name), custom_time)
+
+    def download(self, name, path, size=None):
+        shutil.copyfile(self.path(name), path)
+
+    def upload(self, name, path, content_type, custom_time=None):
+        with _LocalWriter(self._create(name), custom_time) as writer, open(path, 'rb') as f:
+            shutil.copyfileobj(f, writer, 1024 * 1024)
+
+    def upload_bytes(self, name, data, content_type, custom_time=None):
+        with _LocalWriter(self._create(name), custom_time) as writer:
+            writer.write(data.encode('utf-8') if isinstance(data, str) else data)
+
+    def read_text(self, name):
+        with open(self.path(name), encoding='utf-8') as f:
+            return f.read()
+
+    def delete(self, name):
+        os.unlink(self.path(name))
+
+    def touch(self, name, custom_time):
+        timestamp = custom_time.timestamp()
+        os.utime(self.path(name), (timestamp, timestamp))
+
+    def public_url(self, name):
+        return f'{self.base_url}/{urllib.parse.quote(name)}'
+
+    def _signature(self, name, expires):
+        return hmac.new(self.secret, f'{name}\n{expires}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def signed_url(self, name, expires_at):
+        expires = int(expires_at.timestamp())
+        query = urllib.parse.urlencode({'expires': expires, 'signature': self._signature(name, expires)})
+        return f'{self.public_url(name)}?{query}'
+
+    def verify(self, name, expires, signature):
+        """Tell whether a signed URL's parameters are genuine and not yet expired"""
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if datetime.now(timezone.utc).timestamp() > expires:
+            return False
+        return hmac.compare_digest(self._signature(name, expires), signature or '')
+
+    def upload_url(self, name):
+        return f'{self.base_url}/{urllib.parse.quote(name)}?uploadType=resumable'
+
+
+class SignedUrlCache:
+    """Signed read URLs, reused for each object until shortly before they expire.
+
+    URLs are valid for `lifetime` and are handed out only while at least
+    `margin` of that remains, so a client always has time to use one.
+    """
+
+    def __init__(self, store, lifetime=timedelta(minutes=30), margin=timedelta(minutes=5)):
+        self.store = store
+        self.lifetime = lifetime
+        self.margin = margin
+        self._urls = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Return a signed URL for an object and the time it expires"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            cached = self._urls.get(name)
+        if cached is not None and cached[1] - now > self.margin:
+            return cached
+
+        # Whole seconds, so the expiry reported matches the one signed
+        expires_at = (now + self.lifetime).replace(microsecond=0)
+        entry = (self.store.signed_url(name, expires_at), expires_at)
+        with self._lock:
+            self._urls = {key: value for key, value in self._urls.items() if value[1] - now > self.margin}
+            self._urls[name] = entry
+        return entry
+
+
+def create_store(backend, bucket_name=None, local_dir=None, secret=None, **gcs_options):
+    """Create the storage backend named by `backend`: 'gcs' or 'local'"""
+    if backend == 'gcs':
+        return GCSStore(bucket_name, **gcs_options)
+    if backend == 'local':
+        return LocalStore(local_dir, secret=secret)
+    raise ValueError(f'Unknown storage backend: {backend}')
@@ -0,0 +1,157 @@
+import base64
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# Hits only move an object's custom time forward once it is this old,
+# so that popular videos do not cost a metadata write on every upload
+REFRESH_AFTER = timedelta(days=1)
+
+
+def stored_digest(info):
+    """Identify an object's content from the checksums storage keeps for it.
+
+    Returns None when storage has no MD5 (composite objects, local storage),
+    in which case the content has to be hashed as it is downloaded.
+    """
+    if not info.md5_hash:
+        return None
+    return f'md5:{info.md5_hash}:crc32c:{info.crc32c}:size:{info.size}'
+
+
+class ContentHash:
+    """Hashes content as it goes by into a digest.
+
+    With `checksums`, the digest is the one stored_digest gives for the same
+    content stored in a bucket, so an upload hashed on its way in and a
+    direct upload of the same file share their dedup key. Otherwise it is a
+    SHA-256.
+    """
+
+    def __init__(self, checksums=False):
+        self.size = 0
+        if checksums:
+            import google_crc32c
+            self._md5 = hashlib.md5()
+            self._crc32c = google_crc32c.Checksum()
+        else:
+            self._sha256 = hashlib.sha256()
+        self._checksums = checksums
+
+    def update(self, data):
+        self.size += len(data)
+        if self._checksums:
+            self._md5.update(data)
+            self._crc32c.update(data)
+        else:
+            self._sha256.update(data)
+
+    def digest(self):
+        if not self._checksums:
+            return f'sha256:{self._sha256.hexdigest()}'
+        # Storage reports both checksums base64-encoded, the CRC32C big-endian
+        md5 = base64.b64encode(self._md5.digest()).decode('ascii')
+        crc32c = base64.b64encode(self._crc32c.digest()).decode('ascii')
+        return f'md5:{md5}:crc32c:{crc32c}:size:{self.size}'
+
+
+class HashingReader:
+    """Wraps a readable file and hashes everything read through it"""
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._hash = ContentHash()
+
+    def read(self, size=-1):
+        data = self._reader.read(size)
+        self._hash.update(data)
+        return data
+
+    def digest(self):
+        return self._hash.digest()
+
+
+class DedupCache:
+    """Content-addressed store of processed videos.
+
+    Outputs are named after a key derived from the input's content and the
+    encoding parameters, so a repeated upload finds the earlier result with a
+    single metadata lookup. Objects carry a custom time that hits move
+    forward; entries older than `ttl_days` count as misses and are
+    overwritten, and a bucket lifecycle rule on daysSinceCustomTime deletes
+    them for good.
+    """
+
+    def __init__(self, store, prefix='processed/cache/', ttl_days=30):
+        self.store = store
+        self.prefix = prefix
+        self.ttl = timedelta(days=ttl_days)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(digest, params):
+        """Derive the cache key for an input digest and encoding parameters"""
+        material = json.dumps({'input': digest, 'params': params}, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def name(self, key, suffix='.mp4'):
+        """Return the object name of an entry, or of one of its files"""
+        return f'{self.prefix}{key}{suffix}'
+
+    def lookup(self, key, suffix='.mp4', refresh=True):
+        """Return the metadata of the processed object for `key`, or None on a miss.
+
+        Entries made of several objects pass refresh=False: only the looked-up
+        object would get a new custom time, so the entry instead expires a
+        day before the lifecycle rule can delete any of its objects.
+        """
+        info = self.store.stat(self.name(key, suffix))
+        ttl = self.ttl if refresh else self.ttl - REFRESH_AFTER
+        now = datetime.now(timezone.utc)
+        stamp = None
+        if info is not None:
+            stamp = info.custom_time or info.time_created
+        if info is not None and stamp is not None and now - stamp > ttl:
+            with self._lock:
+                self.expired += 1
+            info = None
+        with self._lock:
+            if info is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if refresh and info is not None and (stamp is None or now - stamp > REFRESH_AFTER):
+            self.store.touch(info.name, now)
+        return info
+
+    @contextmanager
+    def claim(self, key):
+        """Hold `key` while its output is produced, so identical inputs are processed once"""
+        with self._lock:
+            entry = self._claims.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._claims[key]
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+            }
@@ -3,6 +3,9 @@
 # Set project ID (replace with your project ID)
 PROJECT_ID=$(gcloud config get-value project)
 
+# Delete processed videos that have not been reused for DEDUP_TTL_DAYS (30 by default)
+gsutil lifecycle set lifecycle.json gs://gdc25-video-bucket
+
 # Build and deploy to Cloud Run
 gcloud run deploy video-compressor \
   --source . \
@@ -10,9 +13,18 @@ gcloud run deploy video-compressor \
   --memory 2Gi \
   --cpu 2 \
   --timeout 15m \
+  --no-cpu-throttling \
+  --session-affinity \
   --allow-unauthenticated
 
+# Jobs keep running after /process has answered, so CPU must stay allocated
+# between requests, and status polls should reach the instance running the job
+
 echo "Make sure the Cloud Run service account has Storage Admin permissions:"
 echo "gcloud projects add-iam-policy-binding ${PROJECT_ID} \\"
 echo "  --member=serviceAccount:${PROJECT_ID}@appspot.gserviceaccount.com \\"
-echo "  --role=roles/storage.admin"
\ No newline at end of file
+echo "  --role=roles/storage.admin"
+echo "Download links are signed by the same service account through the IAM API, which needs:"
+echo "gcloud iam service-accounts add-iam-policy-binding ${PROJECT_ID}@appspot.gserviceaccount.com \\"
+echo "  --member=serviceAccount:${PROJECT_ID}@appspot.gserviceaccount.com \\"
+echo "  --role=roles/iam.serviceAccountTokenCreator"
@@ -0,0 +1,307 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from dedup import ContentHash
+
+# Bytes copied from a request body to the spool file at a time
+COPY_CHUNK_SIZE = 1024 * 1024
+
+CONTENT_RANGE = re.compile(r'^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$')
+
+
+class IngestError(Exception):
+    """Raised when an upload being ingested was abandoned or stalled"""
+
+
+class IngestFull(Exception):
+    """Raised when an upload is announced while the server is receiving as many as it may"""
+
+
+class IngestTooLarge(ValueError):
+    """Raised when an upload is larger than the server accepts"""
+
+
+def parse_content_range(value):
+    """Parse a Content-Range header into (first byte, total size); either may be None.
+
+    A missing header means the body is the whole upload.
+    """
+    if not value:
+        return 0, None
+    match = CONTENT_RANGE.match(value.strip())
+    if match is None:
+        raise ValueError(f'Invalid Content-Range: {value}')
+    start, _, total = match.groups()
+    return (int(start) if start is not None else None), (int(total) if total != '*' else None)
+
+
+def parse_length(value):
+    """Parse a byte count header; None when it is missing"""
+    if not value:
+        return None
+    if not value.strip().isdigit():
+        raise ValueError(f'Invalid length: {value}')
+    return int(value)
+
+
+class IngestSession:
+    """An upload received in chunks and spooled to disk, readable while it arrives.
+
+    Chunks must arrive in order: bytes already received are skipped, so a
+    client can resend a chunk whose response it lost, and a chunk starting
+    past the received bytes is refused. The total size is fixed by the
+    first request that gives one, and no upload may exceed `max_bytes`.
+    The content is hashed as it is written, with `checksums` into the
+    digest a bucket would report for it. Readers block until enough data
+    has arrived, and fail once the upload has stalled for `idle_timeout`
+    seconds; callbacks registered with `on_available` are called instead
+    of blocking.
+    """
+
+    def __init__(self, name, directory, total=None, idle_timeout=300, checksums=False, max_bytes=None):
+        self.name = name
+        self.directory = directory
+        self.path = os.path.join(directory, 'input')
+        self.total = total
+        self.received = 0
+        self.complete = False
+        self.error = None
+        self.updated = time.time()
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self._file = open(self.path, 'wb')
+        self._hash = ContentHash(checksums)
+        self._write_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._callbacks = []
+        self._watchdog = None
+
+    def write(self, start, stream, length, total=None):
+        """Append a chunk of `length` bytes that starts at offset `start`, read from `stream`.
+
+        Returns the number of bytes received so far; nothing is written when
+        the chunk starts past them. Raises IngestTooLarge for a chunk past
+        `max_bytes`, and ValueError for a total that differs from the one
+        given before or a chunk that ends past it.
+        """
+        with self._write_lock:
+            if self.error is not None:
+                raise self.error
+            if total is not None and self.total is None:
+                if self.max_bytes is not None and total > self.max_bytes:
+                    raise IngestTooLarge(f'Uploads may be at most {self.max_bytes} bytes')
+                self.total = total
+            elif total is not None and total != self.total:
+                raise ValueError(f'Upload size changed from {self.total} to {total} bytes')
+            if start is None or start > self.received:
+                return self.received
+            if self.total is not None and start + length > self.total:
+                raise ValueError(f'Chunk ends past the upload size of {self.total} bytes')
+            if self.max_bytes is not None and start + length > self.max_bytes:
+                raise IngestTooLarge(f'Uploads may be at most {self.max_bytes} bytes')
+
+            # Skip the part of a resent chunk that has already arrived
+            skip = self.received - start
+            while skip > 0:
+                data = stream.read(min(skip, COPY_CHUNK_SIZE))
+                if not data:
+                    return self.received
+                skip -= len(data)
+                length -= len(data)
+
+            while length > 0:
+                data = stream.read(min(length, COPY_CHUNK_SIZE))
+                if not data:
+                    break
+                self._file.write(data)
+                self._file.flush()
+                self._hash.update(data)
+                length -= len(data)
+                with self._condition:
+                    self.received += len(data)
+                    self.updated = time.time()
+                    self._condition.notify_all()
+                self._run_callbacks()
+
+            if self.total is not None and self.received >= self.total:
+                self._file.close()
+                with self._condition:
+                    self.complete = True
+                    self._condition.notify_all()
+                self._run_callbacks()
+            return self.received
+
+    def abort(self, message):
+        """Fail the upload, waking any reader"""
+        with self._condition:
+            if not self.complete:
+                self.error = IngestError(message)
+                self._condition.notify_all()
+        self._run_callbacks()
+
+    def on_available(self, size, callback):
+        """Call `callback()` once `size` bytes have arrived, the upload is complete or it has failed.
+
+        An upload that stalls for `idle_timeout` seconds fails, so the
+        callback always comes. It runs on the thread that wrote the data.
+        """
+        with self._condition:
+            if self.received < size and not self.complete and self.error is None:
+                self._callbacks.append((size, callback))
+                if self._watchdog is None:
+                    self._watch(self.idle_timeout)
+                return
+        callback()
+
+    def _run_callbacks(self):
+        with self._condition:
+            if not self._callbacks:
+                return
+            done = self.complete or self.error is not None
+            due = [callback for size, callback in self._callbacks if done or self.received >= size]
+            self._callbacks = [(size, callback) for size, callback in self._callbacks if not done and self.received < size]
+        for callback in due:
+            callback()
+
+    def _watch(self, delay):
+        # Called with the condition held
+        self._watchdog = threading.Timer(delay, self._check_stalled)
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def _check_stalled(self):
+        with self._condition:
+            self._watchdog = None
+            if not self._callbacks:
+                return
+            idle = time.time() - self.updated
+            if idle < self.idle_timeout:
+                self._watch(self.idle_timeout - idle)
+                return
+        self.abort(f'Upload stalled for {self.idle_timeout} seconds')
+
+    def wait_for(self, size):
+        """Block until `size` bytes have arrived or the upload is complete, returning the bytes received"""
+        with self._condition:
+            while self.received < size and not self.complete and self.error is None:
+                if not self._condition.wait(timeout=self.idle_timeout) and time.time() - self.updated >= self.idle_timeout:
+                    self.error = IngestError(f'Upload stalled for {self.idle_timeout} seconds')
+            if self.error is not None:
+                raise self.error
+            return self.received
+
+    def wait(self):
+        """Block until the upload is complete and return its content digest"""
+        self.wait_for(float('inf'))
+        return self._hash.digest()
+
+    def reader(self):
+        """Open the upload for reading from the start, while it arrives"""
+        return _SpoolReader(self)
+
+    def remove(self):
+        self.abort('Upload was discarded')
+        with self._write_lock:
+            self._file.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class _SpoolReader:
+    """Reads a spooled upload like a file, waiting for bytes that have not arrived yet"""
+
+    def __init__(self, session):
+        self._session = session
+        self._file = open(session.path, 'rb')
+        self._position = 0
+
+    def read(self, size=-1):
+        target = float('inf') if size is None or size < 0 else self._position + size
+        available = self._session.wait_for(target)
+        data = self._file.read(max(0, min(target, available) - self._position))
+        self._position += len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class IngestSessions:
+    """Uploads being received by this server, by object name.
+
+    Only names handed out by `issue` can be received, each once, and at
+    most `max_sessions` uploads are announced or in progress at a time,
+    each of at most `max_bytes`.
+    Names not started within `idle_timeout` seconds are forgotten. Uploads
+    that stall for `idle_timeout` seconds are discarded, as are finished
+    ones left unprocessed for `retention` seconds.
+    """
+
+    def __init__(self, idle_timeout=300, retention=3600, root=None, max_sessions=32, checksums=False,
+                 max_bytes=None):
+        self.idle_timeout = idle_timeout
+        self.checksums = checksums
+        self.retention = retention
+        self.root = root
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._issued = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def issue(self, name):
+        """Allow one upload of `name` to be started, or raise IngestFull"""
+        with self._lock:
+            self._purge()
+            if len(self._issued) + len(self._sessions) >= self.max_sessions:
+                raise IngestFull()
+            self._issued[name] = time.time()
+
+    def create(self, name, total=None):
+        """Start receiving an issued upload, returning None if `name` was not issued or was already started.
+
+        Raises IngestTooLarge, leaving the name issued, if `total` is more
+        than `max_bytes`.
+        """
+        if self.max_bytes is not None and total is not None and total > self.max_bytes:
+            raise IngestTooLarge(f'Uploads may be at most {self.max_bytes} bytes')
+        with self._lock:
+            self._purge()
+            if self._issued.pop(name, None) is None:
+                return None
+            directory = tempfile.mkdtemp(prefix='ingest-', dir=self.root)
+            session = self._sessions[name] = IngestSession(
+                name, directory, total, self.idle_timeout, self.checksums, self.max_bytes
+            )
+        return session
+
+    def get(self, name):
+        with self._lock:
+            return self._sessions.get(name)
+
+    def close(self, name):
+        """Forget an upload and delete its spooled data"""
+        with self._lock:
+            session = self._sessions.pop(name, None)
+        if session is not None:
+            session.remove()
+
+    def _purge(self):
+        now = time.time()
+        for name, issued in list(self._issued.items()):
+            if now - issued > self.idle_timeout:
+                del self._issued[name]
+        for name, session in list(self._sessions.items()):
+            limit = self.retention if session.complete else self.idle_timeout
+            if now - session.updated > limit:
+                del self._sessions[name]
+                session.remove()
@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobQueue:
+    """Bounded queue of transcoding jobs run by a fixed pool of worker threads.
+
+    Jobs are plain dicts so they can be returned as JSON. The handler is
+    called with the job and returns a dict of results that is merged into it;
+    any exception marks the job as failed. Finished jobs are kept for
+    `retention` seconds so clients can still read their status.
+
+    A job can be submitted before its input is ready to be worked on. It then
+    waits outside the queue, with status 'waiting', without holding a worker,
+    but it counts against the queue's capacity so that it always fits in once
+    it is ready.
+    """
+
+    def __init__(self, handler, workers, max_queued, retention=3600):
+        self._handler = handler
+        self._workers = workers
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._retention = retention
+        self._jobs = {}
+        self._finished = {}
+        self._running = 0
+        self._waiting = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return self._workers
+
+    def _start(self):
+        # Threads are started on first use so that importing the app stays cheap
+        if self._threads:
+            return
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._work, name=f'transcode-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, when_ready=None, **params):
+        """Queue a job and return a copy of it, or raise QueueFull.
+
+        With `when_ready`, the job waits until `when_ready(callback)` calls
+        the callback it is given, and only then joins the queue.
+        """
+        job = {
+            'jobId': str(uuid.uuid4()),
+            'status': 'queued' if when_ready is None else 'waiting',
+            'createdAt': _now(),
+            'startedAt': None,
+            'finishedAt': None,
+            'error': None,
+            **params,
+        }
+        with self._lock:
+            self._start()
+            self._purge()
+            if self._queue.maxsize and self._queue.qsize() + self._waiting >= self._queue.maxsize:
+                raise QueueFull()
+            self._jobs[job['jobId']] = job
+            if when_ready is None:
+                self._queue.put_nowait(job['jobId'])
+            else:
+                self._waiting += 1
+            submitted = dict(job)
+        if when_ready is not None:
+            when_ready(lambda: self._enqueue(job))
+        return submitted
+
+    def _enqueue(self, job):
+        """Move a waiting job into the queue; its place was reserved when it was submitted"""
+        with self._lock:
+            if job['status'] != 'waiting':
+                return
+            job['status'] = 'queued'
+            self._waiting -= 1
+            self._queue.put_nowait(job['jobId'])
+
+    def get(self, job_id):
+        """Return a copy of a job, with its queue position while it waits"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            if job['status'] == 'queued':
+                waiting = list(self._queue.queue)
+                if job_id in waiting:
+                    job['queuePosition'] = waiting.index(job_id) + 1
+            return job
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job while it runs"""
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def stats(self):
+        """Return queue depth and worker utilization"""
+        with self._lock:
+            return {
+                'workers': self._workers,
+                'running': self._running,
+                'queued': self._queue.qsize(),
+                'waiting': self._waiting,
+                'capacity': self._queue.maxsize,
+            }
+
+    def _purge(self):
+        cutoff = time.time() - self._retention
+        expired = [job_id for job_id, finished in self._finished.items() if finished < cutoff]
+        for job_id in expired:
+            del self._finished[job_id]
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs[job_id]
+                job['status'] = 'running'
+                job['startedAt'] = _now()
+                self._running += 1
+                params = dict(job)
+            try:
+                result = self._handler(params) or {}
+                fields = {'status': 'done', **result}
+            except Exception as e:
+                print(f"Job {job_id} failed: {str(e)}")
+                fields = {'status': 'failed', 'error': str(e)}
+            with self._lock:
+                job.update(fields, finishedAt=_now())
+                self._finished[job_id] = time.time()
+                self._running -= 1
+            self._queue.task_done()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
@@ -0,0 +1,246 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Stage duration buckets, in seconds
+TIME_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Encode speed buckets, as multiples of real time
+SPEED_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+# Stage timings and byte counts of the job running in the current thread
+_job_stats = contextvars.ContextVar('job_stats', default=None)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    # Byte counts pass a million quickly, and %g would round them
+    return str(int(value)) if value == int(value) else f'{value:g}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with optional labels"""
+
+    def __init__(self, name, documentation, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    labels = _format_labels(self.labels + ('le',), key + (le,))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, key)
+                lines.append(f'{self.name}_sum{labels} {self._sums[key]:g}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram(
+    'video_stage_seconds', 'Time spent in each processing stage of a job', ['stage']
+)
+JOB_SECONDS = Histogram(
+    'video_job_seconds', 'Time from a job starting to finishing, by processing path', ['path']
+)
+ENCODE_SPEED = Histogram(
+    'video_encode_speed', 'Seconds of video encoded per second of encoding, by processing path',
+    ['path'], buckets=SPEED_BUCKETS
+)
+BYTES = Counter(
+    'video_bytes_total', 'Bytes read from (in) and written to (out) storage', ['direction']
+)
+JOBS = Counter(
+    'video_jobs_total', 'Finished jobs by status and processing path', ['status', 'path']
+)
+PRESETS = Counter(
+    'video_encodes_total', 'Encodes by the x264 preset the scheduler picked', ['preset']
+)
+
+
+class JobStats:
+    """Stage timings, byte counts and encode progress of one job.
+
+    Every change is passed to `publish` as keyword fields, so that a copy
+    of the job can be updated while it runs.
+    """
+
+    def __init__(self, publish):
+        self.timings = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._publish = publish
+
+    def add_stage(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        self._publish(timings={name: round(value, 3) for name, value in self.timings.items()})
+
+    def add_bytes(self, direction, amount):
+        if direction == 'in':
+            self.bytes_in += amount
+        else:
+            self.bytes_out += amount
+        self._publish(bytesIn=self.bytes_in, bytesOut=self.bytes_out)
+
+    def publish(self, **fields):
+        self._publish(**fields)
+
+    def progress_callback(self, duration):
+        """Return a callback for transcode progress reports, adding percent complete when the duration is known"""
+        def report(progress):
+            progress = dict(progress)
+            if duration and progress['outTime'] is not None:
+                progress['percent'] = round(min(100.0, 100 * progress['outTime'] / duration), 1)
+            self._publish(progress=progress)
+        return report
+
+
+def start_job_stats(publish):
+    """Start collecting stage timings for the job running in the current thread"""
+    stats = JobStats(publish)
+    _job_stats.set(stats)
+    return stats
+
+
+def observe_stage(stage, seconds):
+    """Record time spent in a stage, globally and for the current job"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    stats = _job_stats.get()
+    if stats is not None:
+        stats.add_stage(stage, seconds)
+
+
+def count_bytes(direction, amount):
+    """Record bytes moved from ('in') or to ('out') storage, globally and for the current job"""
+    BYTES.inc(amount, direction=direction)
+    stats = _job_stats.get()
+    if stats is not None:
+        stats.add_bytes(direction, amount)
+
+
+def publish(**fields):
+    """Copy fields into the current job, if there is one"""
+    stats = _job_stats.get()
+    if stats is not None:
+        stats.publish(**fields)
+
+
+def progress_callback(duration):
+    """Return a progress callback for the current job, or None outside a job"""
+    stats = _job_stats.get()
+    if stats is None:
+        return None
+    return stats.progress_callback(duration)
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as a processing stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+class MeteredStream:
+    """Wraps a storage reader or writer, adding up the bytes moved and the time spent blocked on it"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self._stream.read(size)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return data
+
+    def write(self, data):
+        start = time.perf_counter()
+        written = self._stream.write(data)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return written
+
+    def __enter__(self):
+        self._stream.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Closing a writer flushes its last chunk, which counts as time blocked on it
+        start = time.perf_counter()
+        try:
+            return self._stream.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def render(extra_lines=()):
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,123 @@
+import collections
+import math
+import threading
+from contextlib import contextmanager
+
+# x264 presets from best compression to fastest, with their rough encoding speed relative to 'medium'
+PRESET_SPEEDS = {
+    'veryslow': 0.15,
+    'slower': 0.35,
+    'slow': 0.6,
+    'medium': 1.0,
+    'fast': 1.25,
+    'faster': 1.6,
+    'veryfast': 2.5,
+    'superfast': 3.5,
+    'ultrafast': 6.0,
+}
+
+
+class EncoderPolicy:
+    """Picks the x264 preset and thread count of each encode from the backlog.
+
+    Every queued job is assumed to need about as much work as the one being
+    scheduled, so with `queued` jobs waiting for `workers` the last of them
+    finishes after 1 + ceil(queued / workers) encodes. The policy uses the
+    slowest of `presets` (best compression) whose estimate keeps that within
+    `target_seconds`, and the fastest one when none does.
+
+    Work is measured in seconds of 640x360 video, and the speed of one core
+    at 'medium' is learned from finished encodes as a moving average. When
+    nothing is queued, an encode may also use the cores of idle workers.
+    """
+
+    def __init__(self, presets, target_seconds, cpu_count, threads, initial_speed=2.0, smoothing=0.2):
+        unknown = [preset for preset in presets if preset not in PRESET_SPEEDS]
+        if unknown or not presets:
+            raise ValueError(f"Unknown x264 presets: {', '.join(unknown) or '(none)'}")
+        self.presets = sorted(presets, key=PRESET_SPEEDS.get)
+        self.target_seconds = target_seconds
+        self.cpu_count = cpu_count
+        self.threads = threads
+        self.speed = initial_speed
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def choose(self, stats, work, cores=None):
+        """Return the preset and threads for an encode of `work` seconds, given the queue's stats().
+
+        `cores` overrides the cores the estimate assumes, for encodes that are
+        split across several single-threaded processes. With an unknown
+        amount of work only the backlog is considered.
+        """
+        threads = self.threads
+        if stats['queued'] == 0:
+            threads = max(threads, self.cpu_count // max(1, stats['running']))
+        cores = cores or threads
+        rounds = 1 + math.ceil(stats['queued'] / max(1, stats['workers']))
+
+        with self._lock:
+            speed = self.speed
+        estimate = None
+        for preset in self.presets:
+            if work is None:
+                # Without a duration, slow down only when nothing else is waiting
+                if stats['queued'] == 0:
+                    break
+                continue
+            estimate = rounds * work / (speed * PRESET_SPEEDS[preset] * cores)
+            if estimate <= self.target_seconds:
+                break
+        return {
+            'preset': preset,
+            'threads': threads,
+            'cores': cores,
+            'work': work,
+            'queued': stats['queued'],
+            'estimate': round(estimate, 1) if estimate is not None else None,
+        }
+
+    def observe(self, decision, seconds):
+        """Learn the speed of one core from an encode made with a decision from choose()"""
+        if not decision['work'] or seconds <= 0:
+            return
+        speed = decision['work'] / seconds / PRESET_SPEEDS[decision['preset']] / decision['cores']
+        with self._lock:
+            self.speed += self.smoothing * (speed - self.speed)
+
+
+class CoreBudget:
+    """The cores ffmpeg processes may use at once, shared by every encode.
+
+    Each encode takes its cores for as long as it runs and waits while
+    there are not enough free. Requests are served in arrival order, so an
+    encode that needs several cores is not starved by single-core ones.
+    """
+
+    def __init__(self, cores):
+        self.cores = cores
+        self.free = cores
+        self._waiting = collections.deque()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def take(self, cores):
+        """Hold `cores` cores (at most all of them) for the duration of a `with` block"""
+        cores = min(cores, self.cores)
+        if cores <= 0:
+            yield
+            return
+        ticket = object()
+        with self._condition:
+            self._waiting.append(ticket)
+            while self._waiting[0] is not ticket or self.free < cores:
+                self._condition.wait()
+            self._waiting.popleft()
+            self.free -= cores
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.free += cores
+                self._condition.notify_all()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip('flask')
+
+# The app reads its settings on import: keep objects in a scratch directory
+os.environ['STORAGE_BACKEND'] = 'local'
+os.environ['LOCAL_STORAGE_DIR'] = tempfile.mkdtemp(prefix='video-api-test-')
+
+import app as video_app  # noqa: E402
+from scheduler import CoreBudget, EncoderPolicy  # noqa: E402
+
+CACHED = 'processed/cache/' + 'a' * 64 + '.mp4'
+
+
+@pytest.fixture
+def client():
+    video_app.store.upload_bytes('uploads/secret.mp4', b'upload', 'video/mp4')
+    video_app.store.upload_bytes(CACHED, b'GOOD', 'video/mp4')
+    return video_app.app.test_client()
+
+
+def test_processed_videos_get_download_links(client):
+    response = client.get('/download-url', query_string={'name': CACHED})
+    assert response.status_code == 200
+    assert client.get(response.get_json()['url']).data == b'GOOD'
+
+    assert client.get('/download', query_string={'name': CACHED}).status_code == 200
+
+
+@pytest.mark.parametrize('name', [
+    'processed/cache/../../uploads/secret.mp4',
+    'processed/cache/./../../uploads/secret.mp4',
+    'processed/cache/' + 'b' * 64 + '.mp4',
+    'uploads/secret.mp4',
+])
+@pytest.mark.parametrize('route', ['/download', '/download-url'])
+def test_only_existing_processed_videos_are_signed(client, route, name):
+    before = dict(video_app.signed_urls._urls)
+
+    assert client.get(route, query_string={'name': name}).status_code == 404
+    assert video_app.signed_urls._urls == before
+
+
+@pytest.mark.parametrize('name', [
+    'uploads/../' + CACHED,
+    'uploads/%2e%2e/' + CACHED,
+    'uploads/./../' + CACHED,
+    CACHED,
+])
+@pytest.mark.parametrize('method', ['post', 'put'])
+def test_storage_writes_stay_in_uploads(client, method, name):
+    response = getattr(client, method)('/storage/' + name, data=b'EVIL', content_type='video/mp4')
+
+    assert response.status_code == 403
+    with video_app.store.open_read(CACHED) as reader:
+        assert reader.read() == b'GOOD'
+
+
+def test_storage_accepts_new_uploads(client):
+    response = client.put('/storage/uploads/new.mp4', data=b'video', content_type='video/mp4')
+
+    assert response.status_code == 200
+    with video_app.store.open_read('uploads/new.mp4') as reader:
+        assert reader.read() == b'video'
+
+
+def test_encodes_hold_as_many_cores_as_they_get_threads(monkeypatch):
+    # On an idle 8-core server one encode gets the cores of every worker
+    monkeypatch.setattr(video_app, 'core_budget', CoreBudget(8))
+    monkeypatch.setattr(video_app, 'encoder_policy', EncoderPolicy(['medium'], 300, cpu_count=8, threads=2))
+    options, decision = video_app.schedule_encoder(video_app.ENCODE_OPTIONS, {})
+    assert options['threads'] == decision['threads'] == 8
+
+    with video_app.encoding('transcode', {}, decision):
+        assert video_app.core_budget.free == 0
+    with video_app.encoding('remux', {}):
+        assert video_app.core_budget.free == 8 - video_app.ENCODE_THREADS
+    assert video_app.core_budget.free == 8
+
+
+def test_ingest_refuses_uploads_that_are_too_large(client, monkeypatch):
+    monkeypatch.setattr(video_app.ingest_sessions, 'max_bytes', 8)
+    video_app.ingest_sessions.issue('uploads/big.mp4')
+    url = '/ingest/uploads/big.mp4'
+
+    assert client.post(url, headers={'X-Upload-Content-Length': '9'}).status_code == 413
+    assert client.post(url, headers={'X-Upload-Content-Length': '6'}).status_code == 200
+
+    assert client.put(url, data=b'0123456', headers={'Content-Range': 'bytes 0-6/6'}).status_code == 400
+    assert client.put(url, data=b'0123', headers={'Content-Range': 'bytes 0-3/7'}).status_code == 400
+    assert client.put(url, data=b'0123', headers={'Content-Range': 'bytes 0-3/6'}).status_code == 308
+    video_app.ingest_sessions.close('uploads/big.mp4')
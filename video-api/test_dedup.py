@@ -0,0 +1,96 @@
+import base64
+import hashlib
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from blobstore import LocalStore, ObjectInfo
+from dedup import ContentHash, DedupCache, HashingReader, stored_digest
+
+PARAMS = {'options': {'crf': 28, 'vf': 'scale=640:360'}, 'target': [640, 360, 30, 800000]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalStore(str(tmp_path / 'storage'))
+
+
+@pytest.fixture
+def cache(store):
+    return DedupCache(store, 'processed/cache/', ttl_days=30)
+
+
+def put(store, name, age):
+    store.upload_bytes(name, b'video', 'video/mp4', custom_time=datetime.now(timezone.utc) - age)
+
+
+def test_keys_depend_on_the_input_and_every_parameter():
+    key = DedupCache.key('md5:abc', PARAMS)
+
+    assert key == DedupCache.key('md5:abc', {'target': PARAMS['target'], 'options': dict(PARAMS['options'])})
+    assert key != DedupCache.key('md5:abd', PARAMS)
+    assert key != DedupCache.key('md5:abc', dict(PARAMS, options={'crf': 23, 'vf': 'scale=640:360'}))
+
+
+def test_stored_digest_needs_an_md5():
+    info = ObjectInfo('uploads/a.mp4', 10, 'q1+2w==', 'AAAAAA==', None, None)
+    assert stored_digest(info) == 'md5:q1+2w==:crc32c:AAAAAA==:size:10'
+    assert stored_digest(info._replace(md5_hash=None)) is None
+
+
+def test_a_fresh_entry_is_a_hit(store, cache):
+    key = DedupCache.key('md5:abc', PARAMS)
+    assert cache.lookup(key) is None
+
+    put(store, cache.name(key), timedelta(hours=1))
+
+    assert cache.lookup(key).name == 'processed/cache/' + key + '.mp4'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'expired': 0, 'hitRate': 0.5}
+
+
+def test_an_entry_past_the_ttl_is_a_miss(store, cache):
+    key = DedupCache.key('md5:abc', PARAMS)
+    put(store, cache.name(key), timedelta(days=31))
+
+    assert cache.lookup(key) is None
+    assert cache.stats()['expired'] == 1
+
+
+def test_hits_move_the_custom_time_forward_once_a_day_old(store, cache):
+    key = DedupCache.key('md5:abc', PARAMS)
+    put(store, cache.name(key), timedelta(days=2))
+
+    cache.lookup(key)
+
+    assert datetime.now(timezone.utc) - store.stat(cache.name(key)).custom_time < timedelta(minutes=1)
+
+
+def test_entries_of_several_objects_expire_a_day_early_and_are_not_touched(store, cache):
+    key = DedupCache.key('md5:abc', PARAMS)
+    put(store, cache.name(key, '/manifest.json'), timedelta(days=29, hours=12))
+
+    assert cache.lookup(key, '/manifest.json', refresh=False) is None
+
+
+def test_hashing_reader_digests_what_it_reads():
+    reader = HashingReader(io.BytesIO(b'some video bytes'))
+    assert reader.read(4) + reader.read() == b'some video bytes'
+
+    assert reader.digest() == 'sha256:' + hashlib.sha256(b'some video bytes').hexdigest()
+
+
+def test_content_hash_with_checksums_matches_the_bucket_digest():
+    google_crc32c = pytest.importorskip('google_crc32c')
+    data = b'some video bytes'
+    content = ContentHash(checksums=True)
+    content.update(data[:4])
+    content.update(data[4:])
+
+    info = ObjectInfo(
+        'uploads/a.mp4', len(data),
+        base64.b64encode(hashlib.md5(data).digest()).decode(),
+        base64.b64encode(google_crc32c.Checksum(data).digest()).decode(),
+        None, None
+    )
+    assert content.digest() == stored_digest(info)
@@ -0,0 +1,200 @@
+import hashlib
+import io
+import threading
+import time
+
+import pytest
+
+from ingest import (
+    IngestError, IngestFull, IngestSession, IngestSessions, IngestTooLarge, parse_content_range, parse_length
+)
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = IngestSession('uploads/a.mp4', str(tmp_path), total=10, idle_timeout=1)
+    yield session
+    session.remove()
+
+
+def send(session, start, data, total=10):
+    return session.write(start, io.BytesIO(data), len(data), total)
+
+
+def test_content_range_gives_the_first_byte_and_total():
+    assert parse_content_range('bytes 0-8388607/20000000') == (0, 20000000)
+    assert parse_content_range('bytes 8388608-16777215/*') == (8388608, None)
+    assert parse_content_range('bytes */20000000') == (None, 20000000)
+    assert parse_content_range(None) == (0, None)
+
+
+@pytest.mark.parametrize('value', ['bytes=0-10/20', 'bytes 0-10', 'items 0-1/2', 'bytes a-b/c'])
+def test_invalid_content_ranges_raise_value_error(value):
+    with pytest.raises(ValueError):
+        parse_content_range(value)
+
+
+def test_lengths_must_be_whole_numbers():
+    assert parse_length('1024') == 1024
+    assert parse_length(None) is None
+    assert parse_length('') is None
+    for value in ('-1', '1e3', 'ten', '12 34'):
+        with pytest.raises(ValueError):
+            parse_length(value)
+
+
+def test_chunks_in_order_complete_the_upload(session):
+    assert send(session, 0, b'01234') == 5
+    assert not session.complete
+    assert send(session, 5, b'56789') == 10
+
+    assert session.complete
+    with open(session.path, 'rb') as f:
+        assert f.read() == b'0123456789'
+
+
+def test_a_resent_chunk_only_adds_what_is_new(session):
+    send(session, 0, b'01234')
+
+    assert send(session, 3, b'34567') == 8
+    with session.reader() as reader:
+        assert reader.read(8) == b'01234567'
+
+
+def test_a_chunk_past_the_received_bytes_is_refused(session):
+    send(session, 0, b'012')
+
+    assert send(session, 5, b'56789') == 3
+    assert send(session, None, b'') == 3
+
+
+def test_readers_wait_for_bytes_that_have_not_arrived(session):
+    send(session, 0, b'01234')
+    result = []
+    with session.reader() as reader:
+        thread = threading.Thread(target=lambda: result.append(reader.read(8)))
+        thread.start()
+        time.sleep(0.05)
+        assert thread.is_alive()
+        send(session, 5, b'56789')
+        thread.join(timeout=5)
+
+    assert result == [b'01234567']
+
+
+def test_a_stalled_upload_fails_its_readers(session):
+    send(session, 0, b'01234')
+
+    with session.reader() as reader, pytest.raises(IngestError):
+        reader.read()
+
+
+def test_wait_returns_the_content_digest(session):
+    send(session, 0, b'0123456789')
+
+    assert session.wait() == 'sha256:' + hashlib.sha256(b'0123456789').hexdigest()
+
+
+def test_on_available_calls_back_once_enough_has_arrived(session):
+    calls = []
+    session.on_available(4, lambda: calls.append('head'))
+    session.on_available(float('inf'), lambda: calls.append('all'))
+
+    send(session, 0, b'012')
+    assert calls == []
+    send(session, 3, b'3456')
+    assert calls == ['head']
+    send(session, 7, b'789')
+    assert calls == ['head', 'all']
+
+    session.on_available(4, lambda: calls.append('late'))
+    assert calls[-1] == 'late'
+
+
+def test_on_available_calls_back_when_the_upload_stalls(session):
+    called = threading.Event()
+    session.on_available(4, called.set)
+
+    assert called.wait(timeout=5)
+    assert isinstance(session.error, IngestError)
+
+
+def test_only_issued_names_can_be_uploaded_once(tmp_path):
+    sessions = IngestSessions(root=str(tmp_path))
+    assert sessions.create('uploads/a.mp4') is None
+
+    sessions.issue('uploads/a.mp4')
+    session = sessions.create('uploads/a.mp4', 10)
+    assert sessions.get('uploads/a.mp4') is session
+    assert sessions.create('uploads/a.mp4') is None
+
+    sessions.close('uploads/a.mp4')
+    assert sessions.get('uploads/a.mp4') is None
+
+
+def test_issued_and_live_uploads_are_capped(tmp_path):
+    sessions = IngestSessions(root=str(tmp_path), max_sessions=2)
+    sessions.issue('uploads/a.mp4')
+    sessions.create('uploads/a.mp4')
+    sessions.issue('uploads/b.mp4')
+
+    with pytest.raises(IngestFull):
+        sessions.issue('uploads/c.mp4')
+
+    sessions.close('uploads/a.mp4')
+    sessions.issue('uploads/c.mp4')
+
+
+def test_names_not_started_in_time_are_forgotten(tmp_path):
+    sessions = IngestSessions(idle_timeout=0.05, root=str(tmp_path), max_sessions=1)
+    sessions.issue('uploads/a.mp4')
+    time.sleep(0.1)
+
+    sessions.issue('uploads/b.mp4')
+    assert sessions.create('uploads/a.mp4') is None
+
+
+def test_the_first_total_given_is_final(tmp_path):
+    session = IngestSession('uploads/a.mp4', str(tmp_path), idle_timeout=1)
+    try:
+        assert send(session, 0, b'01234', total=None) == 5
+        assert send(session, 5, b'567', total=8) == 8
+        assert session.complete
+
+        with pytest.raises(ValueError):
+            send(session, 8, b'', total=10)
+    finally:
+        session.remove()
+
+
+def test_a_different_total_is_refused(session):
+    with pytest.raises(ValueError):
+        send(session, 0, b'01234', total=20)
+    assert session.received == 0
+
+
+def test_a_chunk_past_the_total_is_refused(session):
+    send(session, 0, b'01234')
+
+    with pytest.raises(ValueError):
+        send(session, 5, b'56789ABCDE')
+    with pytest.raises(ValueError):
+        send(session, 3, b'3456789AB')
+    assert session.received == 5
+
+
+def test_uploads_past_max_bytes_are_refused(tmp_path):
+    sessions = IngestSessions(root=str(tmp_path), max_bytes=8)
+    sessions.issue('uploads/a.mp4')
+    with pytest.raises(IngestTooLarge):
+        sessions.create('uploads/a.mp4', 9)
+
+    # Without a declared size, the chunks themselves are held to the limit
+    session = sessions.create('uploads/a.mp4')
+    assert send(session, 0, b'0123', total=None) == 4
+    with pytest.raises(IngestTooLarge):
+        send(session, 4, b'45678', total=None)
+    with pytest.raises(IngestTooLarge):
+        send(session, 4, b'', total=9)
+    assert session.received == 4
+    sessions.close('uploads/a.mp4')
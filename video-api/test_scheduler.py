@@ -0,0 +1,75 @@
+import pytest
+
+from scheduler import EncoderPolicy
+
+PRESETS = ['slow', 'medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast']
+
+
+def stats(queued=0, running=1, workers=4):
+    return {'workers': workers, 'running': running, 'queued': queued, 'capacity': 16, 'waiting': 0}
+
+
+def policy(**options):
+    # One core encodes 2 seconds of video per second at 'medium'
+    return EncoderPolicy(PRESETS, target_seconds=300, cpu_count=4, threads=1, **options)
+
+
+def test_unknown_presets_are_refused():
+    with pytest.raises(ValueError):
+        EncoderPolicy(['medium', 'warp'], 300, 4, 1)
+    with pytest.raises(ValueError):
+        EncoderPolicy([], 300, 4, 1)
+
+
+def test_an_idle_server_uses_the_slowest_preset_that_fits():
+    decision = policy().choose(stats(), work=60)
+
+    assert decision['preset'] == 'slow'
+    # With nothing queued the encode also gets the cores of idle workers
+    assert decision['threads'] == 4
+
+
+def test_a_backlog_shifts_to_faster_presets():
+    # 8 queued jobs on 4 workers make 3 rounds of 600s of work on one core,
+    # 900s at 'medium', so only presets at least 3x faster fit in 300s
+    decision = policy().choose(stats(queued=8, running=4), work=600)
+
+    assert decision['threads'] == 1
+    assert decision['preset'] == 'superfast'
+    assert decision['estimate'] <= 300
+
+
+def test_the_fastest_preset_is_used_when_none_fits():
+    decision = policy().choose(stats(queued=100, running=4), work=3600)
+
+    assert decision['preset'] == 'ultrafast'
+    assert decision['estimate'] > 300
+
+
+def test_an_unknown_amount_of_work_only_looks_at_the_backlog():
+    assert policy().choose(stats(), work=None)['preset'] == 'slow'
+    assert policy().choose(stats(queued=1), work=None)['preset'] == 'ultrafast'
+
+
+def test_cores_override_the_threads_in_the_estimate():
+    decision = policy().choose(stats(queued=4, running=4), work=1200, cores=4)
+
+    assert decision['cores'] == 4
+    assert decision['threads'] == 1
+    assert decision['preset'] == 'medium'
+
+
+def test_observed_encodes_update_the_speed():
+    encoder = policy(smoothing=0.5)
+    decision = encoder.choose(stats(queued=4, running=4), work=100)
+
+    assert decision['preset'] == 'slow'
+
+    # Twice as fast as assumed: 100s of work at 'slow' (0.6x medium) on one core
+    encoder.observe(decision, 100 / (4.0 * 0.6))
+    assert encoder.speed == pytest.approx(3.0)
+
+    before = encoder.speed
+    encoder.observe(dict(decision, work=None), 10)
+    encoder.observe(decision, 0)
+    assert encoder.speed == before
@@ -0,0 +1,136 @@
+import io
+import struct
+
+from transcode import _drain_stderr, choose_path, is_streamable, parse_progress, with_progress
+
+
+def box(box_type, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+FTYP = box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2avc1mp41')
+
+
+def test_mp4_with_the_index_first_is_streamable():
+    assert is_streamable(FTYP + box(b'moov', b'\x00' * 100) + box(b'mdat', b'\x00' * 1000))
+
+
+def test_mp4_with_the_index_last_is_not_streamable():
+    assert not is_streamable(FTYP + box(b'free') + box(b'mdat', b'\x00' * 1000) + box(b'moov'))
+
+
+def test_mp4_with_a_64_bit_box_size_is_followed():
+    large = struct.pack('>I4sQ', 1, b'wide', 16)
+    assert is_streamable(FTYP + large + box(b'moov'))
+    assert not is_streamable(FTYP + large + box(b'mdat'))
+
+
+def test_mp4_whose_index_lies_beyond_the_head_is_not_streamable():
+    head = FTYP + struct.pack('>I4s', 10 * 1024 * 1024, b'free')
+    assert not is_streamable(head)
+
+
+def test_a_corrupt_box_size_is_not_streamable():
+    assert not is_streamable(FTYP + struct.pack('>I4s', 4, b'junk') + box(b'moov'))
+
+
+def test_other_containers_are_streamable():
+    webm = b'\x1a\x45\xdf\xa3' + b'\x00' * 60
+    transport_stream = b'\x47' + b'\x00' * 187
+    assert is_streamable(webm)
+    assert is_streamable(transport_stream)
+
+
+TARGET = (640, 360, 30, 800 * 1000)
+
+
+def probed(video=None, audio=None, **format_fields):
+    """A minimal ffprobe report: one H.264 640x360 30fps stream at 500k and AAC audio unless overridden"""
+    streams = [dict({
+        'codec_type': 'video', 'codec_name': 'h264', 'pix_fmt': 'yuv420p',
+        'width': 640, 'height': 360, 'avg_frame_rate': '30/1', 'bit_rate': '500000',
+    }, **(video or {}))]
+    if audio is not False:
+        streams.append(dict({'codec_type': 'audio', 'codec_name': 'aac'}, **(audio or {})))
+    return {'streams': streams, 'format': dict({'duration': '60.0'}, **format_fields)}
+
+
+def test_a_file_that_meets_the_target_is_remuxed():
+    assert choose_path(probed(), *TARGET) == 'remux'
+    assert choose_path(probed(audio=False), *TARGET) == 'remux'
+
+
+def test_only_the_audio_is_encoded_when_the_video_fits():
+    assert choose_path(probed(audio={'codec_name': 'opus'}), *TARGET) == 'audio'
+
+
+def test_video_outside_the_target_is_transcoded():
+    for video in (
+        {'codec_name': 'hevc'},
+        {'pix_fmt': 'yuv444p'},
+        {'width': 1280, 'height': 720},
+        {'avg_frame_rate': '60/1'},
+        {'bit_rate': '2000000'},
+    ):
+        assert choose_path(probed(video=video), *TARGET) == 'transcode', video
+
+
+def test_ntsc_frame_rates_count_as_30fps():
+    assert choose_path(probed(video={'avg_frame_rate': '30000/1001'}), *TARGET) == 'remux'
+
+
+def test_the_bitrate_falls_back_to_the_container_then_the_size():
+    assert choose_path(probed(video={'bit_rate': None}, bit_rate='600000'), *TARGET) == 'remux'
+    assert choose_path(probed(video={'bit_rate': None}, bit_rate='900000'), *TARGET) == 'transcode'
+    # A head-only probe knows neither; 6MB over 60 seconds is 800k
+    assert choose_path(probed(video={'bit_rate': None}), *TARGET, size=6 * 1000 * 1000) == 'remux'
+    assert choose_path(probed(video={'bit_rate': None}), *TARGET) == 'transcode'
+
+
+def test_inputs_without_exactly_one_video_stream_are_transcoded():
+    assert choose_path({'streams': [], 'format': {}}, *TARGET) == 'transcode'
+    two_videos = probed()
+    two_videos['streams'].append(dict(two_videos['streams'][0]))
+    assert choose_path(two_videos, *TARGET) == 'transcode'
+
+
+def test_cover_art_is_not_counted_as_video():
+    info = probed()
+    info['streams'].append({'codec_type': 'video', 'codec_name': 'mjpeg', 'disposition': {'attached_pic': 1}})
+    assert choose_path(info, *TARGET) == 'remux'
+
+
+def test_a_progress_block_is_parsed_into_numbers():
+    block = {
+        'frame': '450', 'fps': '89.7', 'speed': '2.99x', 'out_time_us': '15000000',
+        'out_time': '00:00:15.000000', 'progress': 'continue',
+    }
+    assert parse_progress(block) == {'frame': 450, 'fps': 89.7, 'speed': 2.99, 'outTime': 15.0, 'done': False}
+
+
+def test_unknown_progress_values_are_none():
+    block = {'frame': '0', 'fps': '0.00', 'speed': 'N/A', 'out_time_us': 'N/A', 'progress': 'continue'}
+    assert parse_progress(block) == {'frame': 0, 'fps': 0.0, 'speed': None, 'outTime': None, 'done': False}
+    # Before the first frame ffmpeg reports a negative output time
+    assert parse_progress({'out_time_us': '-9223372036854775807', 'progress': 'end'})['outTime'] is None
+    assert parse_progress({'progress': 'end'})['done']
+
+
+def test_progress_blocks_are_reported_and_other_lines_kept():
+    stderr = io.BytesIO(
+        b'Input #0, mov,mp4,m4a,3gp,3g2,mj2, from \'input.mp4\':\n'
+        b'frame=30\nfps=30.0\nstream_0_0_q=28.0\nout_time_us=1000000\nspeed=1.0x\nprogress=continue\n'
+        b'frame=60\nfps=30.0\nout_time_us=2000000\nspeed=1.0x\nprogress=end\n'
+    )
+    reports = []
+    tail = _drain_stderr(stderr, reports.append)
+    tail.join(timeout=5)
+
+    assert [(r['frame'], r['outTime'], r['done']) for r in reports] == [(30, 1.0, False), (60, 2.0, True)]
+    assert tail.text() == "Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'input.mp4':"
+
+
+def test_progress_arguments_go_before_the_inputs():
+    assert with_progress(['ffmpeg', '-i', 'in.mp4', 'out.mp4']) == [
+        'ffmpeg', '-progress', 'pipe:2', '-nostats', '-i', 'in.mp4', 'out.mp4'
+    ]
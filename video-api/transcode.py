@@ -0,0 +1,502 @@
+import collections
+import json
+import os
+import re
+import struct
+import subprocess
+import threading
+
+# Bytes moved per read/write between storage and ffmpeg
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Bytes of the input inspected to decide whether it can be read from a pipe
+HEAD_SIZE = 1024 * 1024
+
+# Lines of ffmpeg's stderr kept for error messages
+STDERR_TAIL_LINES = 50
+
+# Seconds by which the video and audio of a segmented encode may differ in length;
+# frame rate conversion rounds each segment to whole frames, which adds up
+MAX_AV_DRIFT_SECONDS = 0.25
+
+# Fragmented MP4 can be written to a pipe: +faststart needs to seek back
+# and rewrite the file once the encode is finished
+FRAGMENTED_MOVFLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+# Makes ffmpeg write key=value progress blocks to stderr instead of its status line
+PROGRESS_ARGS = ['-progress', 'pipe:2', '-nostats']
+
+# Keys of a progress block; stream_<file>_<stream>_q lines hold each encoder's quantizer
+PROGRESS_KEYS = {
+    'frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time',
+    'dup_frames', 'drop_frames', 'speed', 'progress',
+}
+PROGRESS_LINE = re.compile(r'^(\w+)=\s*(\S*)$')
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg exits with an error"""
+
+
+def is_streamable(head):
+    """Tell whether an input can be decoded from a pipe, given its first bytes.
+
+    MP4/MOV files can only be read front to back when the moov index comes
+    before the media data; files written without +faststart keep it at the
+    end. Other containers (WebM, MKV, MPEG-TS) are streamable.
+    """
+    if head[4:8] != b'ftyp':
+        return True
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box_type = struct.unpack('>I4s', head[offset:offset + 8])
+        if box_type == b'moov':
+            return True
+        if box_type == b'mdat':
+            return False
+        if size == 1:
+            if offset + 16 > len(head):
+                return False
+            size = struct.unpack('>Q', head[offset + 8:offset + 16])[0]
+        if size < 8:
+            return False
+        offset += size
+    # The index lies beyond the inspected bytes
+    return False
+
+
+def probe(path=None, head=None):
+    """Run ffprobe on a file, or on the first bytes of an input, returning its JSON report"""
+    source = path if path is not None else 'pipe:0'
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', source],
+        input=head, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.decode('utf-8', errors='replace'))
+    return json.loads(result.stdout)
+
+
+def _frame_rate(stream):
+    num, _, den = stream.get('avg_frame_rate', '0/0').partition('/')
+    if not den or float(den) == 0:
+        num, _, den = stream.get('r_frame_rate', '0/0').partition('/')
+    return float(num) / float(den) if den and float(den) else None
+
+
+def duration(info):
+    """Return the duration of a probed input in seconds, or None if unknown"""
+    value = info.get('format', {}).get('duration')
+    return float(value) if value else None
+
+
+def stream_duration(info, codec_type):
+    """Return the duration in seconds of a probed input's first stream of a type, or None if unknown"""
+    for stream in info.get('streams', []):
+        if stream.get('codec_type') == codec_type and stream.get('duration'):
+            return float(stream['duration'])
+    return None
+
+
+def has_audio(info):
+    """Tell whether a probed input has an audio stream"""
+    return any(s.get('codec_type') == 'audio' for s in info.get('streams', []))
+
+
+def choose_path(info, max_width, max_height, max_fps, max_bitrate, size=None):
+    """Decide how much work an input needs to meet the output target.
+
+    Returns 'remux' when the H.264 video and AAC audio can be copied as they
+    are, 'audio' when only the audio has to be re-encoded, and 'transcode'
+    otherwise. The video bitrate falls back to the container's total
+    bitrate when the stream does not report one, or to `size` over the
+    duration when only part of the input was probed.
+    """
+    streams = info.get('streams', [])
+    video = [s for s in streams if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')]
+    audio = [s for s in streams if s.get('codec_type') == 'audio']
+    if len(video) != 1:
+        return 'transcode'
+
+    video = video[0]
+    fps = _frame_rate(video)
+    bitrate = video.get('bit_rate') or info.get('format', {}).get('bit_rate')
+    duration = float(info.get('format', {}).get('duration') or 0)
+    if bitrate is None and size and duration:
+        bitrate = size * 8 / duration
+    video_ok = (
+        video.get('codec_name') == 'h264'
+        and video.get('pix_fmt') in ('yuv420p', 'yuvj420p')
+        and 0 < video.get('width', 0) <= max_width
+        and 0 < video.get('height', 0) <= max_height
+        and fps is not None and fps <= max_fps + 0.01
+        and bitrate is not None and int(bitrate) <= max_bitrate
+    )
+    if not video_ok:
+        return 'transcode'
+    if all(s.get('codec_name') == 'aac' for s in audio):
+        return 'remux'
+    return 'audio'
+
+
+def file_command(input_path, output_path, options):
+    """Build an ffmpeg command that encodes one file into a faststart MP4"""
+    import ffmpeg
+
+    return (
+        ffmpeg
+        .input(input_path)
+        .output(output_path, movflags='+faststart', **options)
+        .global_args('-hide_banner')
+        .overwrite_output()
+        .compile()
+    )
+
+
+def pipe_command(options):
+    """Build an ffmpeg command that encodes stdin into fragmented MP4 on stdout"""
+    import ffmpeg
+
+    return (
+        ffmpeg
+        .input('pipe:0')
+        .output('pipe:1', format='mp4', movflags=FRAGMENTED_MOVFLAGS, **options)
+        .global_args('-hide_banner')
+        .compile()
+    )
+
+
+def rendition_command(input_path, output_dir, renditions, options, fps, audio=True, hls_segment_seconds=None):
+    """Build one ffmpeg command that decodes an input once and encodes several renditions.
+
+    `renditions` is a list of (name, spec) pairs where spec holds width,
+    height, maxrate and bufsize. The decoded video is split into one scaled
+    encode per rendition. Without `hls_segment_seconds` each rendition is
+    written to <name>.mp4; with it the renditions form an HLS ladder of
+    fragmented MP4 (CMAF) segments under <name>/ with a master.m3u8, and
+    keyframes are placed every two seconds in every rendition so that
+    segment boundaries line up across them.
+    """
+    import ffmpeg
+
+    source = ffmpeg.input(input_path)
+    split = source['v:0'].filter('fps', fps).filter_multi_output('split', len(renditions))
+    videos = [
+        split[i].filter('scale', spec['width'], spec['height'])
+        for i, (_, spec) in enumerate(renditions)
+    ]
+    audio_options = {'acodec': 'aac', 'audio_bitrate': '128k'} if audio else {}
+
+    if hls_segment_seconds is None:
+        outputs = [
+            ffmpeg.output(
+                *([video, source['a:0']] if audio else [video]),
+                os.path.join(output_dir, f'{name}.mp4'),
+                maxrate=spec['maxrate'], bufsize=spec['bufsize'], movflags='+faststart',
+                **options, **audio_options
+            )
+            for video, (name, spec) in zip(videos, renditions)
+        ]
+        return ffmpeg.merge_outputs(*outputs).global_args('-hide_banner').overwrite_output().compile()
+
+    stream_options = {}
+    variants = []
+    for i, (name, spec) in enumerate(renditions):
+        stream_options[f'maxrate:v:{i}'] = spec['maxrate']
+        stream_options[f'bufsize:v:{i}'] = spec['bufsize']
+        variants.append(f'v:{i},a:{i},name:{name}' if audio else f'v:{i},name:{name}')
+    streams = videos + ([source['a:0']] * len(renditions) if audio else [])
+    return (
+        ffmpeg
+        .output(
+            *streams,
+            os.path.join(output_dir, '%v', 'index.m3u8'),
+            f='hls',
+            hls_time=hls_segment_seconds,
+            hls_playlist_type='vod',
+            hls_segment_type='fmp4',
+            hls_segment_filename=os.path.join(output_dir, '%v', 'segment-%05d.m4s'),
+            master_pl_name='master.m3u8',
+            var_stream_map=' '.join(variants),
+            force_key_frames='expr:gte(t,n_forced*2)',
+            sc_threshold=0,
+            **options, **audio_options, **stream_options
+        )
+        .global_args('-hide_banner')
+        .overwrite_output()
+        .compile()
+    )
+
+
+def run_segmented(input_path, output_path, options, temp_dir, segment_seconds, executor, audio=True, progress=None,
+                  core_budget=None):
+    """Encode a long input as segments in parallel and join them into one faststart MP4.
+
+    The video is cut at keyframes without re-encoding, each segment is
+    encoded by its own ffmpeg process on `executor` (one thread per process,
+    so the executor's size caps the number of busy cores; with
+    `core_budget` each process also takes one of its cores), and the audio
+    is encoded once alongside them so there are no gaps at segment
+    boundaries. The encoded segments are then concatenated with stream
+    copy, and the result is checked for video and audio that drifted apart.
+    Progress adds up the segment encodes: frames and output time so far,
+    and the combined fps and speed of those running.
+    """
+    import ffmpeg
+
+    split_pattern = os.path.join(temp_dir, 'segment-%05d.mkv')
+    run_file(
+        ffmpeg
+        .input(input_path)
+        .output(split_pattern, map='0:v:0', c='copy', f='segment',
+                segment_time=segment_seconds, reset_timestamps=1)
+        .global_args('-hide_banner')
+        .overwrite_output()
+        .compile()
+    )
+    segments = sorted(name for name in os.listdir(temp_dir) if name.startswith('segment-'))
+
+    segment_options = dict(options, threads=1, an=None)
+    segment_progress = _SegmentProgress(progress, len(segments)) if progress is not None else None
+    futures = []
+    for index, name in enumerate(segments):
+        encoded_path = os.path.join(temp_dir, 'encoded-' + name[len('segment-'):-len('.mkv')] + '.mp4')
+        cmd = (
+            ffmpeg
+            .input(os.path.join(temp_dir, name))
+            .output(encoded_path, **segment_options)
+            .global_args('-hide_banner')
+            .overwrite_output()
+            .compile()
+        )
+        on_progress = segment_progress.callback(index) if segment_progress is not None else None
+        futures.append((encoded_path, executor.submit(_run_on_core, core_budget, cmd, on_progress)))
+
+    audio_path = os.path.join(temp_dir, 'audio.m4a')
+    if audio:
+        audio_future = executor.submit(_run_on_core, core_budget, (
+            ffmpeg
+            .input(input_path)
+            .output(audio_path, map='0:a:0', vn=None, acodec='aac', audio_bitrate='128k')
+            .global_args('-hide_banner')
+            .overwrite_output()
+            .compile()
+        ))
+
+    # Wait for every encode, so no process outlives the temporary directory
+    errors = []
+    for _, future in futures + ([(audio_path, audio_future)] if audio else []):
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(e)
+    if errors:
+        raise errors[0]
+
+    list_path = os.path.join(temp_dir, 'segments.txt')
+    with open(list_path, 'w') as f:
+        for encoded_path, _ in futures:
+            f.write(f"file '{encoded_path}'\n")
+
+    video = ffmpeg.input(list_path, f='concat', safe=0)
+    streams = [video['v']]
+    if audio:
+        streams.append(ffmpeg.input(audio_path)['a'])
+    run_file(
+        ffmpeg
+        .output(*streams, output_path, c='copy', movflags='+faststart')
+        .global_args('-hide_banner')
+        .overwrite_output()
+        .compile()
+    )
+
+    if audio:
+        check_av_sync(probe(path=output_path))
+    return len(segments)
+
+
+def check_av_sync(info, max_drift=MAX_AV_DRIFT_SECONDS):
+    """Raise TranscodeError if a probed output's video and audio durations differ by more than `max_drift`"""
+    video = stream_duration(info, 'video')
+    audio = stream_duration(info, 'audio')
+    if video is None or audio is None:
+        raise TranscodeError('Cannot check audio/video sync: stream durations are unknown')
+    if abs(video - audio) > max_drift:
+        raise TranscodeError(f'Video ({video:.3f}s) and audio ({audio:.3f}s) drifted apart after joining segments')
+
+
+def _run_on_core(core_budget, cmd, progress=None):
+    """Run a single-threaded ffmpeg command, holding one core of `core_budget` if given"""
+    if core_budget is None:
+        return run_file(cmd, progress)
+    with core_budget.take(1):
+        return run_file(cmd, progress)
+
+
+def with_progress(cmd):
+    """Add the arguments that make ffmpeg report progress to a compiled command"""
+    return cmd[:1] + PROGRESS_ARGS + cmd[1:]
+
+
+def parse_progress(block):
+    """Turn one of ffmpeg's progress blocks into frames, fps, speed and seconds of output.
+
+    Values ffmpeg does not know yet (reported as N/A) are None.
+    """
+    def number(value, kind=float):
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            return None
+
+    out_time_us = number(block.get('out_time_us'), int)
+    return {
+        'frame': number(block.get('frame'), int),
+        'fps': number(block.get('fps')),
+        'speed': number((block.get('speed') or '').rstrip('x')),
+        'outTime': out_time_us / 1e6 if out_time_us is not None and out_time_us >= 0 else None,
+        'done': block.get('progress') == 'end',
+    }
+
+
+def run_file(cmd, progress=None):
+    """Run an ffmpeg command on files, raising TranscodeError on failure.
+
+    `progress`, if given, is called with each parse_progress() report.
+    """
+    if progress is not None:
+        cmd = with_progress(cmd)
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = _drain_stderr(process.stderr, progress)
+    stderr.join()
+    if process.wait() != 0:
+        raise TranscodeError(stderr.text())
+
+
+def run_pipe(cmd, head, reader, writer, progress=None):
+    """Run an ffmpeg command fed from `reader` while its output goes to `writer`.
+
+    `head` holds bytes already read from `reader`. Reading, encoding and
+    writing overlap: one thread feeds ffmpeg's stdin while the calling thread
+    copies its stdout, chunk by chunk, so nothing is buffered on disk.
+    Returns the number of bytes read and written; `progress` is called as
+    in run_file().
+    """
+    if progress is not None:
+        cmd = with_progress(cmd)
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = _drain_stderr(process.stderr, progress)
+    feed = {'bytes': 0, 'error': None}
+
+    def feed_input():
+        try:
+            chunk = head
+            while chunk:
+                process.stdin.write(chunk)
+                feed['bytes'] += len(chunk)
+                chunk = reader.read(STREAM_CHUNK_SIZE)
+        except BrokenPipeError:
+            # ffmpeg stopped reading; its exit status tells why
+            pass
+        except Exception as e:
+            feed['error'] = e
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed_input, name='ffmpeg-feed', daemon=True)
+    feeder.start()
+    written = 0
+    try:
+        while True:
+            chunk = process.stdout.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+            written += len(chunk)
+    except Exception:
+        process.kill()
+        raise
+    finally:
+        feeder.join()
+        returncode = process.wait()
+        stderr.join()
+        process.stdout.close()
+
+    if feed['error'] is not None:
+        raise feed['error']
+    if returncode != 0:
+        raise TranscodeError(stderr.text())
+    return feed['bytes'], written
+
+
+class _SegmentProgress:
+    """Adds up the progress of segments encoded at the same time"""
+
+    def __init__(self, progress, count):
+        self._progress = progress
+        self._count = count
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def callback(self, index):
+        def update(report):
+            with self._lock:
+                self._segments[index] = report
+                reports = list(self._segments.values())
+            running = [r for r in reports if not r['done']]
+            self._progress({
+                'frame': sum(r['frame'] or 0 for r in reports),
+                'fps': round(sum(r['fps'] or 0 for r in running), 2),
+                'speed': round(sum(r['speed'] or 0 for r in running), 3),
+                'outTime': round(sum(r['outTime'] or 0 for r in reports), 6),
+                'done': len(reports) == self._count and not running,
+            })
+        return update
+
+
+class _StderrTail(threading.Thread):
+    """Reads ffmpeg's stderr so the pipe never fills, keeping the last lines.
+
+    With a `progress` callback, progress blocks are parsed out of the stream
+    and reported instead of being kept.
+    """
+
+    def __init__(self, stream, progress=None):
+        super().__init__(name='ffmpeg-stderr', daemon=True)
+        self._stream = stream
+        self._progress = progress
+        self._lines = collections.deque(maxlen=STDERR_TAIL_LINES)
+
+    def run(self):
+        block = {}
+        for line in self._stream:
+            line = line.decode('utf-8', errors='replace').rstrip()
+            match = PROGRESS_LINE.match(line) if self._progress is not None else None
+            if match and (match.group(1) in PROGRESS_KEYS or match.group(1).startswith('stream_')):
+                block[match.group(1)] = match.group(2)
+                if match.group(1) == 'progress':
+                    self._report(block)
+                    block = {}
+            else:
+                self._lines.append(line)
+        self._stream.close()
+
+    def _report(self, block):
+        # A failing callback must not stop the draining, or ffmpeg would block
+        try:
+            self._progress(parse_progress(block))
+        except Exception as e:
+            print(f"Progress callback failed: {str(e)}")
+
+    def text(self):
+        return '\n'.join(self._lines)
+
+
+def _drain_stderr(stream, progress=None):
+    tail = _StderrTail(stream, progress)
+    tail.start()
+    return tail